@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
+import os
 import sys
 import random
+import time
+import hashlib
 import logging
+import argparse
 from math import log
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from oa_index import load_oa_index, decode
 
 '''
 Returns a map that maps a MeSH UID to the top level of each of 
@@ -23,61 +33,388 @@ def get_term_top_ancestor_nodes():
     return term_trees
 
 '''
-Returns a map that maps the PMCID of all articles in the OA 
-subset to a PMID
+MeSH terms of articles in the OA subset in CSR form. The terms of the 
+article pmc_ids[i] are the codes indices[indptr[i]:indptr[i + 1]], and 
+term_uids[code] is the MeSH UID for a code. pmc_ids is an array of 
+UTF-8 bytes
 '''
-def get_oa_id_map():
-    oa_articles = {}
-    with open("oa_last_10_years.csv", "r") as handle:
-        for line in handle:
-            if not line.startswith("File"):
-                line = line.split(",")
-                oa_articles[line[2]] = line[4]
-    
-    return oa_articles
+class DocTerms:
+    def __init__(self, pmc_ids, term_uids, indptr, indices):
+        self.pmc_ids = pmc_ids
+        self.term_uids = term_uids
+        self.indptr = indptr
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.pmc_ids)
 
 '''
-Gets the MeSH terms for all articles in the PMC open access 
-subset
+Returns the positions of the entries in segments of a flat array that 
+start at starts and have lengths entries, in order
 '''
-def get_pmcid_mesh_terms():
-    article_terms = {}
-    oa_articles = get_oa_id_map()
+def segment_positions(starts, lengths):
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
 
-    pmid_to_pmcid = {val: key for key, val in oa_articles.items()}
-    
-    pmids = set([val for key, val in oa_articles.items()])
+    return np.repeat(starts, lengths) + offsets
+
+def input_stats(fps):
+    stats = [os.stat(fp) for fp in fps]
+
+    return np.array([[stat.st_size, stat.st_mtime_ns] for stat in stats], dtype=np.int64)
 
-    with open("pm_doc_term_counts.csv", "r") as handle:
+'''
+Gets the MeSH terms for all articles in the PMC open access 
+subset as DocTerms. PMIDs in doc_terms_fp are joined to PMCIDs in 
+oa_list_fp through a single PMID to OA index row map, and MeSH UIDs are 
+stored as integer codes. Only articles that have been indexed are kept, 
+in the order they first appear, with the terms of their last line.
+
+The result is cached to <doc_terms_fp>.cache.npz and reused for as long 
+as the size and mtime of both inputs are unchanged
+'''
+def get_pmcid_mesh_terms(doc_terms_fp="pm_doc_term_counts.csv", 
+                         oa_list_fp="oa_last_10_years.csv"):
+    cache_fp = f"{doc_terms_fp}.cache.npz"
+    inputs = input_stats([doc_terms_fp, oa_list_fp])
+
+    if os.path.isfile(cache_fp):
+        with np.load(cache_fp) as cached:
+            if np.array_equal(cached["inputs"], inputs):
+                return DocTerms(cached["pmc_ids"], cached["term_uids"].tolist(), 
+                                cached["indptr"], cached["indices"])
+
+    index = load_oa_index(oa_list_fp)
+    pmid_rows = {pmid: row for row, pmid in enumerate(decode(index.pmid)) if pmid}
+
+    term_codes = {}
+    line_rows = array("q")
+    line_ends = array("q")
+    codes = array("i")
+
+    with open(doc_terms_fp, "r") as handle:
         for line in handle:
             line = line.strip("\n").split(",")
-            if line[0] in pmids:
-                # should only use articles that have been indexed
-                if line[1]:
-                    article_terms[pmid_to_pmcid[line[0]]] = line[1:]
+            row = pmid_rows.get(line[0])
+            # should only use articles that have been indexed
+            if row is not None and line[1]:
+                codes.extend([term_codes.setdefault(term, len(term_codes)) 
+                                for term in line[1:]])
+                line_rows.append(row)
+                line_ends.append(len(codes))
+
+    line_rows = np.array(line_rows, dtype=np.int64)
+    line_ends = np.array(line_ends, dtype=np.int64)
+    line_starts = np.concatenate(([0], line_ends[:-1]))
+    codes = np.array(codes, dtype=np.int32)
+
+    # one row per article, in order of its first line, with its last line
+    oa_rows, first_lines = np.unique(line_rows, return_index=True)
+    last_lines = len(line_rows) - 1 - np.unique(line_rows[::-1], return_index=True)[1]
+    order = np.argsort(first_lines, kind="stable")
+    lines = last_lines[order]
+
+    lengths = line_ends[lines] - line_starts[lines]
+    doc_terms = DocTerms(np.array(index.pmcid[oa_rows[order]]), list(term_codes.keys()),
+                         np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                         codes[segment_positions(line_starts[lines], lengths)])
+
+    temp_fp = f"{cache_fp}.tmp"
+    with open(temp_fp, "wb") as out:
+        np.savez(out, inputs=inputs, pmc_ids=doc_terms.pmc_ids, 
+                 term_uids=np.array(doc_terms.term_uids), indptr=doc_terms.indptr, 
+                 indices=doc_terms.indices)
+    os.replace(temp_fp, cache_fp)
+
+    return doc_terms
 
-    return article_terms
+'''
+Returns x * log(x) elementwise, with 0 for x == 0
+'''
+def x_log_x(x):
+    return x * np.log(np.where(x > 0, x, 1.0))
 
 '''
-Calculates Shannon index for an article set from the number of 
-occurrences of each top level parent node
+Article x top level node count matrix in CSR form: the counts for the 
+article in row i are data[indptr[i]:indptr[i + 1]] at columns 
+indices[indptr[i]:indptr[i + 1]]. Rows follow pmc_ids, columns follow 
+nodes
 '''
-def shannon(node_counts):
-    sum_total = sum(node_counts.values())
-    props = [val / sum_total for key, val in node_counts.items() if val != 0]
+class NodeCountMatrix:
+    def __init__(self, pmc_ids, nodes, indptr, indices, data):
+        self.pmc_ids = pmc_ids
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    '''
+    Builds the matrix from the DocTerms returned by get_pmcid_mesh_terms 
+    and the map returned by get_term_top_ancestor_nodes, block_size rows 
+    at a time. Each row lists its nodes in the order its terms first hit 
+    them
+    '''
+    @classmethod
+    def from_terms(cls, doc_terms, term_trees, block_size=1 << 18):
+        nodes = [node for key, node_list in term_trees.items() for node in node_list]
+        nodes = list(dict.fromkeys(nodes))
+        node_index = {node: index for index, node in enumerate(nodes)}
+        num_nodes = len(nodes)
+
+        # top level nodes hit by each term code, in CSR form
+        term_nodes = [[node_index[node] for node in term_trees[uid]] 
+                        for uid in doc_terms.term_uids]
+        term_lengths = np.array([len(node_list) for node_list in term_nodes], dtype=np.int64)
+        term_starts = np.concatenate(([0], np.cumsum(term_lengths)[:-1])).astype(np.int64)
+        term_indices = np.array([node for node_list in term_nodes for node in node_list], 
+                                dtype=np.int64)
+
+        row_lengths = []
+        indices = []
+        data = []
+
+        for block_start in range(0, len(doc_terms), block_size):
+            block_end = min(block_start + block_size, len(doc_terms))
+            start, end = doc_terms.indptr[block_start], doc_terms.indptr[block_end]
+            codes = doc_terms.indices[start:end]
+            code_rows = np.repeat(np.arange(block_end - block_start), 
+                                  np.diff(doc_terms.indptr[block_start:block_end + 1]))
+
+            lengths = term_lengths[codes]
+            entry_nodes = term_indices[segment_positions(term_starts[codes], lengths)]
+            entry_rows = np.repeat(code_rows, lengths)
+
+            keys, first_positions, counts = np.unique(entry_rows * num_nodes + entry_nodes,
+                                                      return_index=True, return_counts=True)
+            keys_rows = keys // num_nodes
+            order = np.lexsort((first_positions, keys_rows))
+
+            row_lengths.append(np.bincount(keys_rows, minlength=block_end - block_start))
+            indices.append((keys[order] % num_nodes).astype(np.int32))
+            data.append(counts[order].astype(np.float64))
+
+        indptr = np.zeros(len(doc_terms) + 1, dtype=np.int64)
+        if row_lengths:
+            np.cumsum(np.concatenate(row_lengths), out=indptr[1:])
+            indices = np.concatenate(indices)
+            data = np.concatenate(data)
+        else:
+            indices = np.zeros(0, dtype=np.int32)
+            data = np.zeros(0, dtype=np.float64)
+
+        return cls(doc_terms.pmc_ids, nodes, indptr, indices, data)
+
+    '''
+    Returns the block row, column, and count of every nonzero entry in 
+    rows, where block row j is rows[j]
+    '''
+    def gather(self, rows):
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        block_rows = np.repeat(np.arange(len(rows)), lengths)
+        positions = segment_positions(starts, lengths)
+
+        return block_rows, self.indices[positions], self.data[positions]
+
+    '''
+    Returns the summed node counts of rows as a dense vector
+    '''
+    def column_sums(self, rows):
+        block_rows, columns, counts = self.gather(rows)
+
+        return np.bincount(columns, weights=counts, minlength=len(self.nodes))
 
-    if len(props) > 0:
-        # init
-        product = props[0] ** props[0]
+'''
+Returns the Shannon index of a vector of node counts
+'''
+def shannon_from_counts(counts):
+    total = counts.sum()
+    if total == 0:
+        raise ValueError("all node counts are 0, something is very wrong")
 
-        for prop in props[1:]:
-            product = product * (prop ** prop)
-    
-    if product == 0:
-        raise ValueError("product is 0, something is very wrong")
+    return log(total) - x_log_x(counts).sum() / total
 
-    return log(1 / product)
+'''
+Keeps the Shannon index of the node counts of a set of NodeCountMatrix 
+rows up to date as rows are added. With N the total count and S the sum 
+of c * log(c) over the counts, the index is log(N) - S / N, so scoring 
+or adding a row only touches the nodes it hits. Scores a whole block of 
+candidate rows against the current counts at once, touching only the 
+nonzero entries of those rows
+'''
+class MatrixShannonTracker:
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.counts = np.zeros(len(matrix.nodes), dtype=np.float64)
+        self.total = 0.0
+        self.sum_c_log_c = 0.0
+
+    '''
+    Returns a tracker for matrix with the state of a snapshot
+    '''
+    @classmethod
+    def from_snapshot(cls, matrix, counts, total, sum_c_log_c):
+        tracker = cls(matrix)
+        tracker.counts = np.array(counts, dtype=np.float64)
+        tracker.total = float(total)
+        tracker.sum_c_log_c = float(sum_c_log_c)
+
+        return tracker
+
+    '''
+    Returns a copy of the counts, total, and sum of c log c
+    '''
+    def snapshot(self):
+        return self.counts.copy(), self.total, self.sum_c_log_c
+
+    def index(self):
+        return self.shannon(self.total, self.sum_c_log_c)
+
+    @staticmethod
+    def shannon(total, sum_c_log_c):
+        if total == 0:
+            return 0.0
+
+        return log(total) - sum_c_log_c / total
+
+    '''
+    Returns the Shannon index the counts would have after adding each 
+    of rows on its own
+    '''
+    def score(self, rows):
+        block_rows, columns, counts = self.matrix.gather(rows)
+        current = self.counts[columns]
+        delta = x_log_x(current + counts) - x_log_x(current)
+
+        totals = self.total + np.bincount(block_rows, weights=counts, minlength=len(rows))
+        sums = self.sum_c_log_c + np.bincount(block_rows, weights=delta, minlength=len(rows))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.log(totals) - sums / totals
+
+        return np.where(totals > 0, scores, 0.0)
+
+    def add(self, row):
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        columns = self.matrix.indices[start:end]
+        counts = self.matrix.data[start:end]
+
+        self.sum_c_log_c += (x_log_x(self.counts[columns] + counts) - 
+                             x_log_x(self.counts[columns])).sum()
+        self.total += counts.sum()
+        self.counts[columns] += counts
+
+# NodeCountMatrix for worker processes, set by initialize_worker
+WORKER_MATRIX = None
+
+def initialize_worker(matrix):
+    global WORKER_MATRIX
+    WORKER_MATRIX = matrix
+
+'''
+Scores rows of WORKER_MATRIX against a snapshot of a 
+MatrixShannonTracker
+'''
+def score_shard(rows, counts, total, sum_c_log_c):
+    tracker = MatrixShannonTracker.from_snapshot(WORKER_MATRIX, counts, total, sum_c_log_c)
 
+    return tracker.score(rows)
+
+'''
+Scores blocks of candidate rows for a MatrixShannonTracker. Blocks of 
+up to shard_size rows are scored in process, larger blocks are split 
+into shards that are scored in parallel by workers processes against a 
+snapshot of the tracker and put back together in order, so the scores 
+are the same for any number of workers
+'''
+class ShardedScorer:
+    def __init__(self, tracker, workers=1, shard_size=4096):
+        self.tracker = tracker
+        self.shard_size = shard_size
+        self.max_block_size = shard_size * max(workers, 1)
+        self.executor = None
+        if workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=workers, 
+                                                initializer=initialize_worker, 
+                                                initargs=(tracker.matrix,))
+
+    def score(self, rows):
+        if self.executor is None or len(rows) <= self.shard_size:
+            return self.tracker.score(rows)
+
+        snapshot = self.tracker.snapshot()
+        futures = [self.executor.submit(score_shard, rows[start:start + self.shard_size], 
+                                        *snapshot)
+                    for start in range(0, len(rows), self.shard_size)]
+
+        return np.concatenate([future.result() for future in futures])
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+'''
+Runs one greedy pass over pool, a list of matrix rows, accepting a 
+row if it raises the Shannon index or keeps it above shannon_floor. 
+Rows are scored in blocks against the current counts. Everything 
+before the first accepted row in a block was scored against the same 
+counts it would have been one at a time, so the result is the same as 
+scoring rows one by one. The block size grows while nothing is 
+accepted and shrinks after early acceptances.
+
+Accepted rows are appended to selected_rows, returns the current 
+Shannon index and the rejected rows.
+
+Blocks are scored by scorer, a ShardedScorer, which defaults to scoring 
+in process. A pass can be resumed from position with the rows rejected 
+before it in unused_rows. If given, checkpoint is called after every 
+block with the position of the next block, the rejected rows, and the 
+current Shannon index
+'''
+def selection_pass(tracker, pool, selected_rows, current_shannon, shannon_floor,
+        num_articles_required, logger=None, logger_update_interval=20000, 
+        scorer=None, position=0, unused_rows=None, checkpoint=None):
+    if scorer is None:
+        scorer = ShardedScorer(tracker)
+    pool = np.asarray(pool, dtype=np.int64)
+    if unused_rows is None:
+        unused_rows = []
+    block_size = 64
+
+    while position < len(pool):
+        block = pool[position:position + block_size]
+        scores = scorer.score(block)
+        accepted = np.flatnonzero((scores > current_shannon) | (scores > shannon_floor))
+
+        if len(accepted) == 0:
+            unused_rows.extend(block.tolist())
+            next_position = position + len(block)
+            block_size = min(block_size * 2, scorer.max_block_size)
+        else:
+            first = accepted[0]
+            unused_rows.extend(block[:first].tolist())
+            current_shannon = scores[first]
+            selected_rows.append(int(block[first]))
+            tracker.add(block[first])
+            next_position = position + first + 1
+            block_size = int(min(max(4 * (first + 1), 16), scorer.max_block_size))
+
+        # Update every update_interval
+        if logger and position // logger_update_interval != next_position // logger_update_interval:
+            debug_msg_0 = f"Current Shannon: {current_shannon}"
+            debug_msg_1 = f"{len(selected_rows)} articles"
+            debug_msg_2 = f"index: {next_position}"
+            logger.debug(f"{debug_msg_0}, {debug_msg_1}, {debug_msg_2}")
+
+        position = next_position
+
+        if checkpoint:
+            checkpoint(pool, position, unused_rows, current_shannon)
+
+        if len(selected_rows) > num_articles_required:
+            break
+
+    return float(current_shannon), unused_rows
 
 '''
 Returns the Shannon index for a random sample of articles using 
@@ -88,41 +425,104 @@ def random_sample_shannon(sample_set_size):
     random.seed(42)
 
     term_trees = get_term_top_ancestor_nodes()
-    pmc_doc_terms = get_pmcid_mesh_terms()
-
-    # parent nodes are the parent nodes on the MeSH graph
-    parent_nodes = [node for key, node_list in term_trees.items() for node in node_list]
-    parent_nodes = list(dict.fromkeys(parent_nodes))
-    parent_node_counts = {node: 0 for node in parent_nodes}
+    doc_terms = get_pmcid_mesh_terms()
+    matrix = NodeCountMatrix.from_terms(doc_terms, term_trees)
     
-    # all PMCIDs in the OA subset
-    pmc_ids = list(pmc_doc_terms.keys())
-    logger.debug(f"length pmc_ids: {len(pmc_ids)}")
+    # all rows, one per PMCID in the OA subset
+    rows = list(range(len(matrix.pmc_ids)))
+    logger.debug(f"length pmc_ids: {len(rows)}")
     
-    pmc_ids = random.sample(pmc_ids, sample_set_size)
-
-    for pmc_id in pmc_ids:
-        for term in pmc_doc_terms[pmc_id]:
-            for node in term_trees[term]:
-                parent_node_counts[node] += 1
+    rows = np.array(random.sample(rows, sample_set_size), dtype=np.int64)
     
-    shannon_index = shannon(parent_node_counts)
+    shannon_index = shannon_from_counts(matrix.column_sums(rows))
 
     logger.info(f"Random sample size: {sample_set_size}")
     logger.info(f"Shannon index: {shannon_index}")
 
     return shannon_index
 
+'''
+Returns the Shannon index of replicates random samples of sample_size 
+rows of WORKER_MATRIX, drawn without replacement with a generator 
+seeded from seed_sequence
+'''
+def sample_shannons(sample_size, replicates, seed_sequence):
+    rng = np.random.default_rng(seed_sequence)
+    num_rows = len(WORKER_MATRIX.pmc_ids)
+
+    return [shannon_from_counts(WORKER_MATRIX.column_sums(
+                rng.choice(num_rows, sample_size, replace=False)))
+            for _ in range(replicates)]
+
+'''
+Runs random_sample_shannon as a batch: the data is loaded once and 
+replicates samples of each size in sample_sizes are scored across a 
+pool of workers processes. Replicates are split into tasks of 
+task_size, each with its own seed spawned from a SeedSequence of seed, 
+so results depend on seed but not on the number of workers. Returns a 
+dict of sample size to an array of Shannon indices
+'''
+def random_sample_shannon_batch(sample_sizes, replicates=1000, workers=1, seed=42, 
+                                task_size=50):
+    logger = logging.getLogger(__name__)
+
+    term_trees = get_term_top_ancestor_nodes()
+    doc_terms = get_pmcid_mesh_terms()
+    matrix = NodeCountMatrix.from_terms(doc_terms, term_trees)
+    logger.debug(f"length pmc_ids: {len(matrix.pmc_ids)}")
+
+    for sample_size in sample_sizes:
+        if sample_size > len(matrix.pmc_ids):
+            raise ValueError(f"Sample size {sample_size} is larger than the " \
+                             f"{len(matrix.pmc_ids)} articles available")
+
+    tasks = []
+    size_seeds = np.random.SeedSequence(seed).spawn(len(sample_sizes))
+    for sample_size, size_seed in zip(sample_sizes, size_seeds):
+        num_tasks = -(-replicates // task_size)
+        for task, task_seed in enumerate(size_seed.spawn(num_tasks)):
+            task_replicates = min(task_size, replicates - task * task_size)
+            tasks.append((sample_size, task_replicates, task_seed))
+
+    results = {sample_size: [] for sample_size in sample_sizes}
+    with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                             initargs=(matrix,)) as executor:
+        futures = [executor.submit(sample_shannons, *task) for task in tasks]
+        for (sample_size, _, _), future in zip(tasks, futures):
+            results[sample_size].extend(future.result())
+
+    return {sample_size: np.array(values) for sample_size, values in results.items()}
+
+'''
+Writes the mean, standard deviation, and quantiles of the Shannon 
+indices for each sample size as a tab separated table, and logs them
+'''
+def write_sample_quantiles(fp, results, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+    logger = logging.getLogger(__name__)
+
+    with open(fp, "w") as out:
+        header = ["sample_size", "replicates", "mean", "std"] + [f"q{q:g}" for q in quantiles]
+        out.write("\t".join(header))
+        out.write("\n")
+
+        for sample_size, values in results.items():
+            row = [sample_size, len(values), values.mean(), values.std()]
+            row.extend(np.quantile(values, quantiles))
+            out.write("\t".join([str(value) for value in row]))
+            out.write("\n")
+
+            logger.info(f"Sample size {sample_size}: mean {values.mean():.4f}, " \
+                        f"median {np.median(values):.4f}, 5%-95% " \
+                        f"{np.quantile(values, 0.05):.4f}-{np.quantile(values, 0.95):.4f}")
+
 def write_ftp_paths(pmcids):
-    article_set = set(pmcids)
+    index = load_oa_index("oa_last_10_years.csv")
+    ftp_paths = decode(index.ftp_path[index.mask(pmcids=set(pmcids))])
 
-    with open("oa_last_10_years.csv", "r") as handle:
-        with open("selected_articles_ftp_paths", "w") as out:
-            for line in handle:
-                line = line.split(",")
-                if line[2] in article_set:
-                    out.write(line[0])
-                    out.write("\n")
+    with open("selected_articles_ftp_paths", "w") as out:
+        for ftp_path in ftp_paths:
+            out.write(ftp_path)
+            out.write("\n")
 
 '''
 Get a logger
@@ -151,85 +551,157 @@ def initialize_logger(name="background_article_selection", debug=False,
     return logger
 
 
-if __name__ == "__main__":
-    logger = initialize_logger(debug=True)
-    logger.info("New run")
+'''
+Returns a digest of the PMCIDs of a NodeCountMatrix, to check that a 
+checkpoint was made from the same inputs
+'''
+def matrix_digest(matrix):
+    return hashlib.sha1(np.ascontiguousarray(matrix.pmc_ids).tobytes()).hexdigest()
+
+'''
+Saves the state of a selection to fp: the selected rows, the tracker's 
+counts, the pool of the current pass with the position in it and the 
+rows it has rejected so far, and the state of the random module, which 
+shuffles the pool of each pass. The file is written to fp.tmp first, 
+so an interrupted save leaves the previous checkpoint in place
+'''
+def save_checkpoint(fp, digest, tracker, selected_rows, num_passes, pool, position, 
+                    unused_rows, current_shannon):
+    counts, total, sum_c_log_c = tracker.snapshot()
+    rng_version, rng_state, rng_gauss = random.getstate()
+
+    temp_fp = f"{fp}.tmp"
+    with open(temp_fp, "wb") as out:
+        np.savez(out, digest=np.array(digest), 
+                 selected_rows=np.array(selected_rows, dtype=np.int64), 
+                 num_passes=num_passes, counts=counts, total=total, 
+                 sum_c_log_c=sum_c_log_c, pool=pool, position=position, 
+                 unused_rows=np.array(unused_rows, dtype=np.int64), 
+                 current_shannon=current_shannon, rng_version=rng_version, 
+                 rng_state=np.array(rng_state, dtype=np.int64), 
+                 rng_gauss=np.nan if rng_gauss is None else rng_gauss)
+    os.replace(temp_fp, fp)
+
+'''
+Loads a checkpoint written by save_checkpoint for matrix and restores 
+the state of the random module. Returns a dict of the selection state, 
+with a MatrixShannonTracker in "tracker"
+'''
+def load_checkpoint(fp, matrix, digest):
+    with np.load(fp) as saved:
+        if str(saved["digest"]) != digest:
+            raise ValueError(f"Checkpoint {fp} was made from different inputs")
+
+        rng_gauss = float(saved["rng_gauss"])
+        random.setstate((int(saved["rng_version"]), tuple(saved["rng_state"].tolist()), 
+                         None if np.isnan(rng_gauss) else rng_gauss))
+
+        return {"tracker": MatrixShannonTracker.from_snapshot(matrix, saved["counts"], 
+                                saved["total"], saved["sum_c_log_c"]),
+                "selected_rows": saved["selected_rows"].tolist(),
+                "num_passes": int(saved["num_passes"]),
+                "pool": saved["pool"],
+                "position": int(saved["position"]),
+                "unused_rows": saved["unused_rows"].tolist(),
+                "current_shannon": float(saved["current_shannon"])}
+
+'''
+Runs the greedy selection over the OA subset and writes the selected 
+articles and their FTP paths. Candidate blocks are scored by workers 
+processes, which gives the same selection as scoring them in process.
+
+The state of the selection is saved to checkpoint_fp at most every 
+checkpoint_interval seconds, and with resume a selection carries on 
+from the last checkpoint. The checkpoint is removed once the selection 
+is written
+'''
+def run_selection(logger, num_articles_required=150000, shannon_floor=4.4, max_passes=3,
+                  workers=1, checkpoint_fp="selection_checkpoint.npz", 
+                  checkpoint_interval=300, resume=False):
 
     term_trees = get_term_top_ancestor_nodes()
-    pmc_doc_terms = get_pmcid_mesh_terms()
+    doc_terms = get_pmcid_mesh_terms()
 
-    # parent nodes are the parent nodes on the MeSH graph
-    parent_nodes = [node for key, node_list in term_trees.items() for node in node_list]
-    parent_nodes = list(dict.fromkeys(parent_nodes))
-    parent_node_counts = {node: 0 for node in parent_nodes}
-    
-    # all PMCIDs in the OA subset
-    pmc_ids = list(pmc_doc_terms.keys())
+    # rows are PMCIDs in the OA subset, columns are the parent nodes on 
+    # the MeSH graph
+    matrix = NodeCountMatrix.from_terms(doc_terms, term_trees)
+    pmc_ids = matrix.pmc_ids
+    digest = matrix_digest(matrix)
     logger.debug(f"length pmc_ids: {len(pmc_ids)}")
 
     # set seed for reproducibility
     random.seed(42)
 
     # init
-    # number of articles desired
-    num_articles_required = 150000
     # rolling current Shannon index for the article set
     current_shannon = 0.0
-    # minimum Shannon index allowed
-    shannon_floor = 4.4
-    # list for selection articles
-    selected_articles = []
+    # matrix rows of the selected articles
+    selected_rows = []
+    # keeps the parent node counts and their Shannon index up to date
+    tracker = MatrixShannonTracker(matrix)
     # debug update after this many articles are checked
     logger_update_interval = 20000
     # get unused articles
-    unused_articles = [pmc_id for pmc_id in pmc_ids]
-    # number of passes to make
-    max_passes = 3
+    unused_rows = list(range(len(pmc_ids)))
     # current pass
     num_passes = 0
-
-    # start adding to selected_articles
-    while len(selected_articles) <= num_articles_required and num_passes < max_passes: 
-        # pool of potential articles
-        putative_article_pool = [pmc_id for pmc_id in unused_articles]
-        # reset, will be added to for additional passes
-        unused_articles = []
-        # shuffle the list
-        random.shuffle(putative_article_pool)
-        
-        logger.debug(f"length article_pool: {len(putative_article_pool)}")
-
-        for index, pmc_id in enumerate(putative_article_pool):
-            new_counts = {key: val for key, val in parent_node_counts.items()}
-            for term in pmc_doc_terms[pmc_id]:
-                for node in term_trees[term]:
-                    new_counts[node] += 1
-
-            next_shannon = shannon(new_counts)
+    # pool, position, and rejected rows of a pass resumed from a checkpoint
+    pool = None
+    position = 0
+    pass_unused_rows = None
+
+    if resume and os.path.isfile(checkpoint_fp):
+        state = load_checkpoint(checkpoint_fp, matrix, digest)
+        tracker = state["tracker"]
+        selected_rows = state["selected_rows"]
+        num_passes = state["num_passes"]
+        pool = state["pool"]
+        position = state["position"]
+        pass_unused_rows = state["unused_rows"]
+        current_shannon = state["current_shannon"]
+        logger.info(f"Resuming from {checkpoint_fp}: {len(selected_rows)} articles, " \
+                    f"pass {num_passes + 1} at index {position}")
+    elif resume:
+        logger.warning(f"No checkpoint at {checkpoint_fp}, starting a new selection")
+
+    last_checkpoint = time.monotonic()
+    def checkpoint(pool, position, pass_unused_rows, current_shannon):
+        nonlocal last_checkpoint
+        if time.monotonic() - last_checkpoint >= checkpoint_interval:
+            save_checkpoint(checkpoint_fp, digest, tracker, selected_rows, num_passes, 
+                            pool, position, pass_unused_rows, current_shannon)
+            last_checkpoint = time.monotonic()
+            logger.debug(f"Saved checkpoint: {len(selected_rows)} articles, " \
+                         f"index: {position}")
+
+    scorer = ShardedScorer(tracker, workers)
+    try:
+        # start adding to selected_rows
+        while len(selected_rows) <= num_articles_required and num_passes < max_passes: 
+            if pool is None:
+                # pool of potential articles
+                putative_article_pool = unused_rows
+                # shuffle the list
+                random.shuffle(putative_article_pool)
+                pool = putative_article_pool
+                position = 0
+                pass_unused_rows = None
             
-            if (next_shannon > current_shannon) or next_shannon > shannon_floor:
-                current_shannon = next_shannon
-                selected_articles.append(pmc_id)
-
-                for term in pmc_doc_terms[pmc_id]:
-                    for node in term_trees[term]:
-                        parent_node_counts[node] += 1
-            else:
-                unused_articles.append(pmc_id)
-            
-            # Update every update_interval
-            if index % logger_update_interval == 0:
-                debug_msg_0 = f"Current Shannon: {current_shannon}"
-                debug_msg_1 = f"{len(selected_articles)} articles"
-                debug_msg_2 = f"index: {index}"
-                logger.debug(f"{debug_msg_0}, {debug_msg_1}, {debug_msg_2}")
+            logger.debug(f"length article_pool: {len(pool)}")
+
+            current_shannon, unused_rows = selection_pass(tracker, pool, selected_rows, 
+                    current_shannon, shannon_floor, num_articles_required, logger, 
+                    logger_update_interval, scorer, position, pass_unused_rows, 
+                    checkpoint)
+            pool = None
             
-            if len(selected_articles) > num_articles_required:
-                break
-        
-        num_passes += 1
-        logger.info(f"completed {num_passes} passes, Shannon: {current_shannon}")
+            num_passes += 1
+            logger.info(f"completed {num_passes} passes, Shannon: {current_shannon}")
+    finally:
+        scorer.close()
     
+    selected_articles = decode(pmc_ids[np.array(selected_rows, dtype=np.int64)])
+
     logger.info(f"Final selection: {len(selected_articles)} articles")
     logger.info(f"Final Shannon: {current_shannon}")
     
@@ -243,3 +715,53 @@ if __name__ == "__main__":
             out.write(f"{article}\n")
 
     write_ftp_paths(selected_articles) 
+
+    if os.path.isfile(checkpoint_fp):
+        os.remove(checkpoint_fp)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", help="'select' (the default) " \
+                                       "selects a diverse background article set, " \
+                                       "'sample' scores random samples to calibrate " \
+                                       "the Shannon floor")
+    select_parser = subparsers.add_parser("select")
+    select_parser.add_argument("-n", "--num-articles", help="Number of articles to " \
+                               "select", type=int, default=150000)
+    select_parser.add_argument("--shannon-floor", help="Minimum Shannon index allowed",
+                               type=float, default=4.4)
+    select_parser.add_argument("--max-passes", help="Number of passes over the unused " \
+                               "articles", type=int, default=3)
+    select_parser.add_argument("-w", "--workers", help="Number of worker processes " \
+                               "scoring candidates", type=int, default=1)
+    select_parser.add_argument("-c", "--checkpoint", help="File to save the state of " \
+                               "the selection to", default="selection_checkpoint.npz")
+    select_parser.add_argument("--checkpoint-interval", help="Seconds between " \
+                               "checkpoints", type=float, default=300)
+    select_parser.add_argument("--resume", help="Resume from the checkpoint if there " \
+                               "is one", action="store_true")
+    sample_parser = subparsers.add_parser("sample")
+    sample_parser.add_argument("-n", "--sample-sizes", help="Sample sizes, space " \
+                               "delimited", nargs="+", type=int, required=True)
+    sample_parser.add_argument("-r", "--replicates", help="Number of samples of each " \
+                               "size", type=int, default=1000)
+    sample_parser.add_argument("-w", "--workers", help="Number of worker processes",
+                               type=int, default=os.cpu_count())
+    sample_parser.add_argument("--seed", help="Random seed", type=int, default=42)
+    sample_parser.add_argument("-o", "--output", help="File to write quantiles to",
+                               default="random_sample_shannon.tsv")
+    argv = sys.argv[1:]
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv = ["select"] + argv
+    args = parser.parse_args(argv)
+
+    if args.command == "sample":
+        logger = initialize_logger(name="random_sample_shannon", debug=True)
+        results = random_sample_shannon_batch(args.sample_sizes, args.replicates, 
+                                              args.workers, args.seed)
+        write_sample_quantiles(args.output, results)
+    else:
+        logger = initialize_logger(debug=True)
+        logger.info("New run")
+        run_selection(logger, args.num_articles, args.shannon_floor, args.max_passes, 
+                      args.workers, args.checkpoint, args.checkpoint_interval, args.resume)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parser as pmc_parser
+
+'''
+The cleanup functions as they were before the patterns were compiled
+once and the passes combined, kept here to check that the output is
+unchanged and to compare timings
+'''
+def legacy_remove_codes(string):
+    entity_regex = re.compile(r"&[^;\s]*;")
+
+    return entity_regex.sub(pmc_parser.parse_entity, string)
+
+def legacy_remove_tags(string):
+    tag_regex = re.compile("<[^>]+>")
+
+    return tag_regex.sub("", string)
+
+def legacy_remove_empty_lines(string):
+    string = string.split("\n")
+    string = [line for line in string if re.search(r"\S", line)]
+
+    for index, line in enumerate(string):
+        line = line.split()
+        if len(line) > 7:
+            string[index] = " ".join(line)
+        else:
+            string[index] = ""
+
+    string = [line for line in string if line]
+
+    return "\n".join(string)
+
+def legacy_parse_abstract(abstract):
+    abstract = re.sub(r"\s*<title>[^<]*</title>", "", abstract)
+    abstract = legacy_remove_tags(abstract)
+    abstract = legacy_remove_codes(abstract)
+
+    return legacy_remove_empty_lines(abstract)
+
+def legacy_parse_body(body):
+    body = "|$|$|".join(body.split("\n"))
+
+    body = re.sub("<sup[^<]*</sup>", "", body)
+    body = re.sub("<td.*</td>", "", body)
+    body = re.sub("<th.*</th>", "", body)
+    body = re.sub(r"\\documentclass\[.*\\end\{document\}", "", body)
+    body = re.sub(r"\s*<title>[^<]*</title>", "", body)
+    body = re.sub(r"\s*<label>[^<]*</label>", "", body)
+
+    body = "\n".join(body.split("|$|$|"))
+
+    body = legacy_remove_tags(body)
+    body = legacy_remove_codes(body)
+
+    return legacy_remove_empty_lines(body)
+
+'''
+Builds a body with num_sections sections, each with a title, several
+paragraphs with entities, xrefs and sups, and a figure. One table and one
+inline LaTeX formula are added to the article
+'''
+def synthetic_body(num_sections=40):
+    paragraph = ("<p>The expression of &#x003b1;-synuclein in CD4<sup>+</sup> "
+                 "T cells <xref ref-type=\"bibr\" rid=\"B1\">1</xref> was increased "
+                 "2&#x000a0;fold &#x02013; relative to controls &amp; healthy "
+                 "donors in <italic>all</italic> of the cohorts studied.</p>\n")
+    section = ("<sec>\n<title>Section</title>\n" + paragraph * 6 +
+               "<fig id=\"f1\">\n<label>Figure 1</label>\n<caption>" + paragraph +
+               "</caption>\n</fig>\n</sec>\n")
+    table = ("<table-wrap>\n<label>Table 1</label>\n<table>\n<thead><tr><th>Group</th>"
+             "<th>Count</th></tr></thead>\n<tbody>\n" +
+             "<tr><td>Control</td><td>60</td></tr>\n" * 20 + "</tbody>\n</table>\n"
+             "</table-wrap>\n")
+    formula = ("<p>The equation <inline-formula><tex-math>\\documentclass[12pt]{minimal}"
+               "\\begin{document}$x^2$\\end{document}</tex-math></inline-formula> "
+               "describes the relationship observed between the groups.</p>\n")
+
+    half = num_sections // 2
+
+    return "<body>\n" + section * half + table + formula + section * half + "</body>\n"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sections", help="Number of sections in the synthetic " \
+                        "body", type=int, default=40)
+    parser.add_argument("-n", "--number", help="Number of calls per timing run",
+                        type=int, default=200)
+    parser.add_argument("-r", "--repeat", help="Number of timing runs, the best is " \
+                        "reported", type=int, default=5)
+    args = parser.parse_args()
+
+    body = synthetic_body(args.sections)
+
+    if legacy_parse_body(body) != pmc_parser.parse_body(body):
+        raise ValueError("parse_body output differs from the legacy implementation")
+    if legacy_parse_abstract(body) != pmc_parser.parse_abstract(body):
+        raise ValueError("parse_abstract output differs from the legacy implementation")
+
+    print(f"body size: {len(body)} characters")
+    for name, legacy, current in [("parse_body", legacy_parse_body, pmc_parser.parse_body),
+                                  ("parse_abstract", legacy_parse_abstract,
+                                      pmc_parser.parse_abstract)]:
+        legacy_time = min(timeit.repeat(lambda: legacy(body), number=args.number,
+                                        repeat=args.repeat)) / args.number
+        current_time = min(timeit.repeat(lambda: current(body), number=args.number,
+                                         repeat=args.repeat)) / args.number
+
+        print(f"{name}: legacy {legacy_time * 1000:.3f} ms, current " \
+              f"{current_time * 1000:.3f} ms, {legacy_time / current_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import shutil
+import difflib
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parser as pmc_parser
+from jats_generator import DEFAULT_SETTINGS, generate_corpus
+
+LATEX_REGEX = re.compile(r"\\documentclass")
+TABLE_CELL_REGEX = re.compile(r"<t[dh][\s>]")
+ESCAPED_MARKUP_REGEX = re.compile(r"&(?:lt|gt|#x0*3[ce]|#6[02]);", re.IGNORECASE)
+
+'''
+Returns the likely causes of a difference between the engines in a
+section, from the raw XML of the article. The causes are the known
+differences listed on parser.ArticleTarget:
+    latex: more than one LaTeX formula, the line engine removes
+        everything from the first to the last
+    tables: table cells, the line engine removes everything from the
+        first to the last cell
+    escaped markup: &lt; or &gt; in a title, which the line engine
+        decodes before removing tags
+    other: none of the above, for example tags sharing a line
+'''
+def difference_causes(section, text):
+    causes = []
+    if section == "body":
+        if len(LATEX_REGEX.findall(text)) > 1:
+            causes.append("latex")
+        if TABLE_CELL_REGEX.search(text):
+            causes.append("tables")
+    if section == "title" and ESCAPED_MARKUP_REGEX.search(text):
+        causes.append("escaped markup")
+
+    return causes or ["other"]
+
+'''
+Returns a short description of the first difference between two texts
+'''
+def first_difference(line_text, stream_text, context=40):
+    matcher = difflib.SequenceMatcher(None, line_text, stream_text, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            return f"{tag} at {i1}: line {line_text[max(i1 - context, 0):i2 + context]!r}" \
+                   f" stream {stream_text[max(j1 - context, 0):j2 + context]!r}"
+
+    return "no difference"
+
+'''
+Parses every file in fps with the line and stream engines and compares
+each section. Returns the number of articles compared, and a dict of
+(section, cause) to the PMC IDs that differ
+'''
+def compare_engines(fps, show=0):
+    differences = {}
+    shown = 0
+
+    for fp in fps:
+        line_output = pmc_parser.parse_xml(fp)
+        stream_output = pmc_parser.parse_xml_stream(fp)
+
+        with open(fp, "r") as handle:
+            text = handle.read()
+
+        for section in pmc_parser.SECTIONS:
+            if line_output[section] == stream_output[section]:
+                continue
+
+            pmc_id = pmc_parser.get_pmc_id(fp)
+            for cause in difference_causes(section, text):
+                differences.setdefault((section, cause), []).append(pmc_id)
+
+            if shown < show:
+                shown += 1
+                print(f"{pmc_id} {section}: " \
+                      f"{first_difference(line_output[section], stream_output[section])}")
+
+    return len(fps), differences
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="Directory of PMC XML files to compare on. " \
+                        "By default a synthetic corpus is generated", default=None)
+    parser.add_argument("-n", "--num-articles", help="Size of the synthetic corpus",
+                        type=int, default=200)
+    parser.add_argument("--show", help="Print the first difference of this many " \
+                        "differing sections", type=int, default=0)
+    for key, value in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    work_dir = None
+    if args.input:
+        fps = sorted([entry.path for entry in os.scandir(args.input)
+                        if entry.name.endswith(pmc_parser.XML_EXTENSIONS)])
+    else:
+        settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS.keys()}
+        work_dir = tempfile.mkdtemp(prefix="pmc-parser-compare-")
+        fps = generate_corpus(work_dir, args.num_articles, settings)
+
+    try:
+        num_articles, differences = compare_engines(fps, args.show)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir)
+
+    differing = len({pmc_id for pmc_ids in differences.values() for pmc_id in pmc_ids})
+    print(f"{differing} of {num_articles} articles differ between the line and stream " \
+          f"engines")
+    for (section, cause), pmc_ids in sorted(differences.items()):
+        print(f"{section:<10} {cause:<16} {len(pmc_ids):>6} articles")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import os
+import random
+import argparse
+
+WORDS = ["expression", "protein", "cells", "patients", "cohort", "analysis", "increased",
+         "decreased", "significant", "response", "immune", "receptor", "signaling",
+         "pathway", "activation", "regulation", "tumor", "mice", "model", "treatment",
+         "samples", "levels", "observed", "compared", "controls", "associated", "gene",
+         "clinical", "study", "results", "data", "function", "role", "mechanism",
+         "infection", "disease", "inflammation", "antibody", "binding", "mutation",
+         "the", "of", "and", "in", "to", "with", "was", "were", "for", "by", "that"]
+
+ENTITIES = ["&#x003b1;", "&#x003b2;", "&#x003b3;", "&#x003bc;", "&#x02013;", "&#x02014;",
+            "&#x000a0;", "&#x000b1;", "&#x000b0;", "&#x02264;", "&#x02265;", "&#x000d7;",
+            "&amp;", "&lt;", "&gt;"]
+
+'''
+Settings for a generated article
+    paragraphs: number of body paragraphs
+    sentences: sentences per paragraph
+    table_density: tables per paragraph
+    table_rows: rows per table
+    entity_density: chance that a word is followed by an HTML entity
+    latex_density: inline LaTeX formulas per paragraph
+    mathml_density: inline MathML formulas per paragraph
+'''
+DEFAULT_SETTINGS = {"paragraphs": 40, "sentences": 5, "table_density": 0.05,
+                    "table_rows": 20, "entity_density": 0.03, "latex_density": 0.05,
+                    "mathml_density": 0.05}
+
+def sentence(rng, entity_density, num_words=None):
+    if num_words is None:
+        num_words = rng.randint(10, 30)
+
+    words = []
+    for _ in range(num_words):
+        word = rng.choice(WORDS)
+        if rng.random() < entity_density:
+            word = f"{word}{rng.choice(ENTITIES)}"
+        words.append(word)
+
+    words[0] = words[0].capitalize()
+
+    return " ".join(words) + "."
+
+def paragraph(rng, settings):
+    sentences = [sentence(rng, settings["entity_density"])
+                    for _ in range(settings["sentences"])]
+
+    # xrefs with sups and italics, as in PMC bodies
+    index = rng.randrange(len(sentences))
+    sentences[index] += f" <xref ref-type=\"bibr\" rid=\"B{index}\">{index + 1}</xref>"
+    index = rng.randrange(len(sentences))
+    sentences[index] = f"CD4<sup>+</sup> <italic>{sentences[index]}</italic>"
+
+    if rng.random() < settings["latex_density"]:
+        sentences.append("<inline-formula><tex-math id=\"M1\">\\documentclass[12pt]" \
+                         "{minimal}\\usepackage{amsmath}\\begin{document}$x^2 + y^2 = z^2$" \
+                         "\\end{document}</tex-math></inline-formula>")
+    if rng.random() < settings["mathml_density"]:
+        sentences.append("<inline-formula><mml:math id=\"M2\"><mml:mi>x</mml:mi>" \
+                         "<mml:mo>=</mml:mo><mml:mn>2</mml:mn></mml:math></inline-formula>")
+
+    return f"<p>{' '.join(sentences)}</p>"
+
+def table(rng, settings, index):
+    lines = [f"<table-wrap id=\"T{index}\" position=\"float\">",
+             f"<label>Table {index}</label>",
+             f"<caption><p>{sentence(rng, settings['entity_density'])}</p></caption>",
+             "<table frame=\"hsides\" rules=\"groups\">",
+             "<thead>",
+             "<tr><th align=\"left\">Group</th><th align=\"left\">Count</th>" \
+             "<th align=\"left\">Mean &#x000b1; SD</th></tr>",
+             "</thead>",
+             "<tbody>"]
+    for row in range(settings["table_rows"]):
+        lines.append(f"<tr><td align=\"left\">{rng.choice(WORDS)}</td>" \
+                     f"<td align=\"left\">{rng.randint(1, 500)}</td>" \
+                     f"<td align=\"left\">{rng.random():.2f} &#x000b1; " \
+                     f"{rng.random():.2f}</td></tr>")
+    lines.extend(["</tbody>", "</table>", "</table-wrap>"])
+
+    return lines
+
+def figure(rng, settings, index):
+    return [f"<fig id=\"F{index}\" position=\"float\">",
+            f"<label>Figure {index}</label>",
+            f"<caption><p>{sentence(rng, settings['entity_density'])}</p></caption>",
+            "</fig>"]
+
+'''
+Returns the text of a synthetic article in the layout of PMC JATS XMLs,
+one element per line for front matter and section structure
+'''
+def generate_article(pmc_id, rng, settings=DEFAULT_SETTINGS):
+    lines = ["<?xml version=\"1.0\" encoding=\"UTF-8\"?>",
+             "<!DOCTYPE article PUBLIC \"-//NLM//DTD JATS (Z39.96) Journal Archiving and " \
+             "Interchange DTD v1.1 20151215//EN\" \"JATS-archivearticle1.dtd\">",
+             "<article xmlns:mml=\"http://www.w3.org/1998/Math/MathML\" " \
+             "xmlns:xlink=\"http://www.w3.org/1999/xlink\" article-type=\"research-article\">",
+             "<front>",
+             "<journal-meta>",
+             "<journal-title-group>",
+             "<journal-title>Synthetic Journal</journal-title>",
+             "</journal-title-group>",
+             "</journal-meta>",
+             "<article-meta>",
+             f"<article-id pub-id-type=\"pmc\">{pmc_id}</article-id>",
+             "<title-group>",
+             f"<article-title>{sentence(rng, settings['entity_density'], 12)[:-1]}" \
+             "</article-title>",
+             "</title-group>",
+             "<abstract>"]
+
+    for title in ["Background", "Methods", "Results"]:
+        lines.extend(["<sec>", f"<title>{title}</title>", paragraph(rng, settings), "</sec>"])
+
+    lines.extend(["</abstract>", "</article-meta>", "</front>", "<body>"])
+
+    tables = 0
+    figures = 0
+    for index in range(settings["paragraphs"]):
+        if index % 8 == 0:
+            if index:
+                lines.append("</sec>")
+            lines.extend([f"<sec id=\"s{index}\">", f"<title>Section {index // 8 + 1}</title>"])
+
+        lines.append(paragraph(rng, settings))
+
+        if rng.random() < settings["table_density"]:
+            tables += 1
+            lines.extend(table(rng, settings, tables))
+        if index % 10 == 5:
+            figures += 1
+            lines.extend(figure(rng, settings, figures))
+
+    lines.extend(["</sec>", "</body>", "<back>", "<ref-list>"])
+    for index in range(20):
+        lines.append(f"<ref id=\"B{index}\"><element-citation><article-title>" \
+                     f"{sentence(rng, 0.0, 8)}</article-title></element-citation></ref>")
+    lines.extend(["</ref-list>", "</back>", "</article>"])
+
+    return "\n".join(lines) + "\n"
+
+'''
+Writes num_articles synthetic articles to output_dir as PMCxxxx.nxml,
+returns their filepaths
+'''
+def generate_corpus(output_dir, num_articles, settings=DEFAULT_SETTINGS, seed=42):
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    fps = []
+    for index in range(num_articles):
+        pmc_id = 1000000 + index
+        fp = os.path.join(output_dir, f"PMC{pmc_id}.nxml")
+        with open(fp, "w") as out:
+            out.write(generate_article(pmc_id, rng, settings))
+        fps.append(fp)
+
+    return fps
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="Directory to write the corpus to",
+                        required=True)
+    parser.add_argument("-n", "--num-articles", help="Number of articles", type=int,
+                        default=100)
+    parser.add_argument("--seed", help="Random seed", type=int, default=42)
+    for key, value in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS.keys()}
+    generate_corpus(args.output, args.num_articles, settings, args.seed)
+
+if __name__ == "__main__":
+    main()
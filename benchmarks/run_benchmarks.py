@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parser as pmc_parser
+from jats_generator import DEFAULT_SETTINGS, generate_corpus
+
+'''
+Calls function on every item of args_list repeat times, returns the
+best total time in seconds
+'''
+def best_time(function, args_list, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            function(*args)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+def result(benchmark, num_articles, seconds, num_bytes):
+    return {"benchmark": benchmark,
+            "articles": num_articles,
+            "seconds": seconds,
+            "ms_per_article": seconds / num_articles * 1000,
+            "articles_per_second": num_articles / seconds,
+            "megabytes_per_second": num_bytes / 1e6 / seconds}
+
+'''
+Returns the body of an article as parse_xml collects it
+'''
+def extract_body(text):
+    start = text.index("<body>")
+    end = text.index("</body>")
+
+    return text[start:end]
+
+'''
+Times both engines, parse_body, remove_codes, and every output writer
+on a synthetic corpus of num_articles
+'''
+def run_size(num_articles, settings, repeat, work_dir):
+    corpus_dir = os.path.join(work_dir, f"corpus-{num_articles}")
+    fps = generate_corpus(corpus_dir, num_articles, settings)
+    corpus_bytes = sum([os.path.getsize(fp) for fp in fps])
+
+    results = []
+    for engine in ["line", "stream"]:
+        parse_function = pmc_parser.get_parse_function(engine)
+        seconds = best_time(parse_function, [(fp,) for fp in fps], repeat)
+        results.append(result(f"parse_xml[{engine}]", num_articles, seconds, corpus_bytes))
+
+    bodies = []
+    for fp in fps:
+        with open(fp, "r") as handle:
+            bodies.append(extract_body(handle.read()))
+    body_bytes = sum([len(body) for body in bodies])
+
+    seconds = best_time(pmc_parser.parse_body, [(body,) for body in bodies], repeat)
+    results.append(result("parse_body", num_articles, seconds, body_bytes))
+
+    untagged = [pmc_parser.remove_tags(body) for body in bodies]
+    seconds = best_time(pmc_parser.remove_codes, [(text,) for text in untagged], repeat)
+    results.append(result("remove_codes", num_articles, seconds, body_bytes))
+
+    records = [(pmc_parser.get_pmc_id(fp), pmc_parser.parse_xml(fp)) for fp in fps]
+    record_bytes = sum([len(value) for _, record in records for value in record.values()])
+
+    for output_format in ["xml", "json", "text", "jsonl"]:
+        output_dir = os.path.join(work_dir, f"output-{output_format}")
+
+        def write_all():
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(output_dir)
+            writer = pmc_parser.get_output_function(output_format, output_dir)
+            for pmc_id, record in records:
+                writer.write(pmc_id, record)
+            writer.close()
+
+        seconds = best_time(write_all, [()], repeat)
+        results.append(result(f"write[{output_format}]", num_articles, seconds, record_bytes))
+
+    shutil.rmtree(corpus_dir)
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+'''
+Prints each benchmark's time against the same benchmark in a previous
+results file
+'''
+def compare(results, baseline_fp):
+    with open(baseline_fp, "r") as handle:
+        baseline = json.load(handle)
+
+    baseline_times = {(r["benchmark"], r["articles"]): r["seconds"]
+                        for r in baseline["results"]}
+
+    print(f"compared to {baseline['commit']}:")
+    for r in results["results"]:
+        key = (r["benchmark"], r["articles"])
+        if key in baseline_times:
+            print(f"{r['benchmark']:<20} {r['articles']:>6} articles: " \
+                  f"{baseline_times[key] / r['seconds']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--sizes", help="Corpus sizes to run, space delimited",
+                        nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("-r", "--repeat", help="Number of timing runs per benchmark, " \
+                        "the best is reported", type=int, default=3)
+    parser.add_argument("-o", "--output", help="File to write results to as JSON, " \
+                        "defaults to benchmark-<commit>.json", default=None)
+    parser.add_argument("-c", "--compare", help="Results file from a previous run to " \
+                        "compare against", default=None)
+    for key, value in DEFAULT_SETTINGS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS.keys()}
+    commit = git_commit()
+
+    results = {"commit": commit,
+               "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "settings": settings,
+               "results": []}
+
+    work_dir = tempfile.mkdtemp(prefix="pmc-parser-bench-")
+    try:
+        for size in args.sizes:
+            for r in run_size(size, settings, args.repeat, work_dir):
+                results["results"].append(r)
+                print(f"{r['benchmark']:<20} {r['articles']:>6} articles: " \
+                      f"{r['ms_per_article']:.3f} ms/article, " \
+                      f"{r['megabytes_per_second']:.2f} MB/s")
+    finally:
+        shutil.rmtree(work_dir)
+
+    output_fp = args.output or f"benchmark-{commit}.json"
+    with open(output_fp, "w") as out:
+        json.dump(results, out, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
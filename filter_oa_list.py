@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import os
+import argparse
+
+from collections import Counter
+
+from oa_index import get_journal, get_year
+from parser import load_allow_list
+
+'''
+A named filter over the OA file list. Every filter that is set has to
+match for a row to be kept:
+    years: inclusive (min, max), either can be None
+    journals: set of journal names, as in journals_counts
+    pmcids: set of PMCIDs
+    licenses: set of values of the License column, like "CC BY"
+'''
+class OAFilter:
+    def __init__(self, name, years=None, journals=None, pmcids=None, licenses=None):
+        self.name = name
+        self.years = years
+        self.journals = journals
+        self.pmcids = pmcids
+        self.licenses = licenses
+
+    def matches(self, journal, year, pmcid, license):
+        if self.years is not None:
+            if self.years[0] is not None and year < self.years[0]:
+                return False
+            if self.years[1] is not None and year > self.years[1]:
+                return False
+        if self.journals is not None and journal not in self.journals:
+            return False
+        if self.pmcids is not None and pmcid not in self.pmcids:
+            return False
+        if self.licenses is not None and license not in self.licenses:
+            return False
+
+        return True
+
+'''
+Parses a year range: "2010-2019", "2010-", "-2019", or "2015"
+'''
+def parse_years(value):
+    if "-" not in value:
+        return (int(value), int(value))
+
+    start, end = value.split("-", 1)
+
+    return (int(start) if start else None, int(end) if end else None)
+
+'''
+Parses a filter given as NAME:KEY=VALUE;KEY=VALUE, for example
+"immunology:years=2015-2019;journals=Front Immunol|J Immunol;license=CC BY".
+Keys are years, journals, license (values separated by "|"), and pmcids
+(a file with one PMCID per line)
+'''
+def parse_filter(spec):
+    if ":" not in spec:
+        raise ValueError(f"Filter has no name: {spec}")
+
+    name, conditions = spec.split(":", 1)
+    oa_filter = OAFilter(name)
+
+    for condition in conditions.split(";"):
+        if not condition.strip():
+            continue
+        key, value = condition.split("=", 1)
+        key = key.strip()
+
+        if key == "years":
+            oa_filter.years = parse_years(value.strip())
+        elif key == "journals":
+            oa_filter.journals = set(value.split("|"))
+        elif key == "license":
+            oa_filter.licenses = set(value.split("|"))
+        elif key == "pmcids":
+            oa_filter.pmcids = load_allow_list(value.strip())
+        else:
+            raise ValueError(f"Unknown filter key {key} in {spec}")
+
+    return oa_filter
+
+'''
+Writes journal counts in the format of parse_journals_from_oa_list.py,
+sorted by count with ties in order of first appearance
+'''
+def write_journal_counts(fp, counts):
+    journals = sorted(counts.items(), key=lambda journal: journal[1], reverse=True)
+
+    with open(fp, "w") as out:
+        for journal, count in journals:
+            out.write(f"{journal},{count}\n")
+
+'''
+Runs every filter over the OA file list in one pass. Writes the rows
+matching each filter to <name>.csv and its journal counts to
+<name>_journals_counts in output_dir
+'''
+def filter_oa_list(oa_list_fp, oa_filters, output_dir="."):
+    names = [oa_filter.name for oa_filter in oa_filters]
+    if len(set(names)) != len(names):
+        raise ValueError("Filter names must be unique")
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {name: open(os.path.join(output_dir, f"{name}.csv"), "w") for name in names}
+    journal_counts = {name: Counter() for name in names}
+
+    try:
+        with open(oa_list_fp, "r") as handle:
+            for line in handle:
+                fields = line.rstrip("\r\n").split(",")
+                if fields[0].startswith("File") or len(fields) < 5:
+                    continue
+
+                journal = get_journal(fields[1])
+                year = get_year(fields[1])
+                pmcid = fields[2]
+                license = fields[5] if len(fields) > 5 else ""
+
+                for oa_filter in oa_filters:
+                    if oa_filter.matches(journal, year, pmcid, license):
+                        outputs[oa_filter.name].write(line)
+                        journal_counts[oa_filter.name][journal] += 1
+    finally:
+        for out in outputs.values():
+            out.close()
+
+    for name, counts in journal_counts.items():
+        write_journal_counts(os.path.join(output_dir, f"{name}_journals_counts"), counts)
+
+    return {name: sum(counts.values()) for name, counts in journal_counts.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="OA file list to filter",
+                        default="oa_file_list.csv")
+    parser.add_argument("-o", "--output", help="Directory to write subsets to",
+                        default=".")
+    parser.add_argument("-f", "--filter", help="A named filter, can be given many " \
+                        "times. Format is NAME:KEY=VALUE;KEY=VALUE, for example " \
+                        "'immunology:years=2015-2019;journals=Front Immunol|J Immunol;" \
+                        "license=CC BY'. Keys are years (a range like 2010-2019, " \
+                        "2010-, or -2019), journals, license (both separated by '|'), " \
+                        "and pmcids (a file with one PMCID per line)",
+                        action="append", required=True)
+    args = parser.parse_args()
+
+    oa_filters = [parse_filter(spec) for spec in args.filter]
+    totals = filter_oa_list(args.input, oa_filters, args.output)
+
+    for name, total in totals.items():
+        print(f"{name}: {total} articles")
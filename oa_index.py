@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import mmap
+import argparse
+
+import numpy as np
+
+COLUMNS = ["ftp_path", "journal", "year", "pmcid", "pmid", "license", "offset", "length"]
+
+'''
+Returns the journal from the Article Citation field of the OA file list,
+for example "Breast Cancer Res" from "Breast Cancer Res. 2001 Nov 9; 3(1):55-60"
+'''
+def get_journal(citation):
+    return citation.split(";")[0].split(".")[0]
+
+'''
+Returns the year from the Article Citation field of the OA file list, or
+0 if there isn't one
+'''
+def get_year(citation):
+    try:
+        return int(citation.split(";")[0].split()[-3])
+    except (ValueError, IndexError):
+        return 0
+
+'''
+Columnar index of an OA file list CSV (oa_file_list.csv or a subset like
+oa_last_10_years.csv). Each column is a NumPy array with one entry per
+data row, string columns are stored as UTF-8 bytes. Columns are:
+    ftp_path, journal, year, pmcid, pmid, license
+    offset, length: position of the row's line in the CSV
+
+The index is kept in <csv>.index/ as .npy files that are memory mapped
+on load, and is rebuilt only when the CSV's size or mtime changes
+'''
+class OAIndex:
+    def __init__(self, csv_path, columns):
+        self.csv_path = csv_path
+        for column in COLUMNS:
+            setattr(self, column, columns[column])
+
+    def __len__(self):
+        return len(self.pmcid)
+
+    '''
+    Returns a boolean mask of the rows matching every filter that is set.
+    years is an inclusive (min, max) tuple, journals and pmcids are
+    collections of strings
+    '''
+    def mask(self, years=None, journals=None, pmcids=None, licenses=None):
+        mask = np.ones(len(self), dtype=bool)
+
+        if years is not None:
+            mask &= (self.year >= years[0]) & (self.year <= years[1])
+        for column, values in [(self.journal, journals), (self.pmcid, pmcids),
+                               (self.license, licenses)]:
+            if values is not None:
+                mask &= np.isin(column, encode(values))
+
+        return mask
+
+    '''
+    Writes the CSV lines of the rows in mask to out, in file order
+    '''
+    def write_lines(self, mask, out):
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return
+
+        with open(self.csv_path, "rb") as handle:
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as csv_map:
+                for offset, length in zip(self.offset[rows].tolist(),
+                                          self.length[rows].tolist()):
+                    out.write(csv_map[offset:offset + length])
+
+'''
+Encodes strings to UTF-8 bytes for comparison against index columns
+'''
+def encode(values):
+    return np.array([value.encode("utf-8") for value in values], dtype=bytes)
+
+'''
+Decodes an index column (or part of one) to a list of strings
+'''
+def decode(values):
+    return [value.decode("utf-8") for value in values.tolist()]
+
+def index_dir(csv_path):
+    return f"{csv_path}.index"
+
+'''
+Builds the index for csv_path in one pass over the file and saves it.
+The header row, starting with "File", is skipped
+'''
+def build_oa_index(csv_path):
+    columns = {column: [] for column in COLUMNS}
+    stat = os.stat(csv_path)
+
+    offset = 0
+    with open(csv_path, "rb") as handle:
+        for raw_line in handle:
+            length = len(raw_line)
+            line = raw_line.decode("utf-8").rstrip("\r\n").split(",")
+
+            if not line[0].startswith("File") and len(line) > 4:
+                citation = line[1]
+                columns["ftp_path"].append(line[0].encode("utf-8"))
+                columns["journal"].append(get_journal(citation).encode("utf-8"))
+                columns["year"].append(get_year(citation))
+                columns["pmcid"].append(line[2].encode("utf-8"))
+                columns["pmid"].append(line[4].encode("utf-8"))
+                columns["license"].append(line[5].encode("utf-8") if len(line) > 5 else b"")
+                columns["offset"].append(offset)
+                columns["length"].append(length)
+
+            offset += length
+
+    dtypes = {"year": np.int16, "offset": np.int64, "length": np.int32}
+    arrays = {column: np.array(values, dtype=dtypes.get(column, bytes))
+                for column, values in columns.items()}
+
+    directory = index_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    meta_fp = os.path.join(directory, "meta.json")
+    # meta.json is written last, so an interrupted build is never loaded
+    if os.path.exists(meta_fp):
+        os.remove(meta_fp)
+
+    for column, array in arrays.items():
+        np.save(os.path.join(directory, f"{column}.npy"), array)
+
+    with open(meta_fp, "w") as out:
+        json.dump({"size": stat.st_size, "mtime": stat.st_mtime_ns,
+                   "rows": len(arrays["pmcid"])}, out)
+
+    return OAIndex(csv_path, arrays)
+
+'''
+Returns the index for csv_path, memory mapped from disk if it is up to
+date, otherwise built first
+'''
+def load_oa_index(csv_path="oa_file_list.csv"):
+    directory = index_dir(csv_path)
+    meta_fp = os.path.join(directory, "meta.json")
+    stat = os.stat(csv_path)
+
+    if os.path.isfile(meta_fp):
+        with open(meta_fp, "r") as handle:
+            meta = json.load(handle)
+
+        if meta["size"] == stat.st_size and meta["mtime"] == stat.st_mtime_ns:
+            arrays = {column: np.load(os.path.join(directory, f"{column}.npy"),
+                                      mmap_mode="r")
+                        for column in COLUMNS}
+            return OAIndex(csv_path, arrays)
+
+    return build_oa_index(csv_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv", help="OA file list CSVs to index", nargs="+")
+    args = parser.parse_args()
+
+    for csv_path in args.csv:
+        index = load_oa_index(csv_path)
+        print(f"{csv_path}: {len(index)} rows", file=sys.stderr)
@@ -1,20 +1,15 @@
-import re
+import numpy as np
 
-from collections import Counter
+from oa_index import load_oa_index, decode
 
 def main():
-    journals = []
-    with open("oa_last_10_years.csv", "r") as handle:
-        for line in handle:
-            line = line.split(",")
-            journal = line[1]
-            journal = journal.split(";")[0]
-            journal = journal.split(".")[0]            
-            journals.append(journal)
+    index = load_oa_index("oa_last_10_years.csv")
 
-    journals = Counter(journals)
-    journals = [[key, val] for key, val in journals.items()]
-    journals = sorted(journals, key = lambda journals: journals[1], reverse=True)
+    # sorted by count, ties in order of first appearance
+    names, first_rows, counts = np.unique(index.journal, return_index=True, 
+                                          return_counts=True)
+    order = np.lexsort((first_rows, -counts))
+    journals = zip(decode(names[order]), counts[order].tolist())
 
     with open("journals_counts", "w") as out:
         for journal in journals:
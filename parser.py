@@ -1,50 +1,476 @@
 #!/usr/bin/env python3
 import os
 import re
+import io
 import sys
 import html
 import json
-import argparse
+import time
+import heapq
 import logging
 import unicodedata
 import traceback
-from pathlib import Path
+from functools import partial
+from contextlib import nullcontext
+from collections import deque, defaultdict
+
+# Modules only some modes need (tarfile, gzip, hashlib, multiprocessing, 
+# xml.etree, argparse, and the optional orjson, zstandard, and pyarrow) 
+# are imported where they are used, so short runs only load what they use
 
 '''
-text_elements is a dict containing text elements like
-title, abstract, and body. Writes output in an XML-like format
+Times a pipeline stage, adding the elapsed time to stats. If within is 
+set, the time is taken back out of that enclosing stage
 '''
-def write_xml(fp, text_elements):
-    with open(f"{fp}.xml", "w") as out:
-        for element in text_elements.keys():
-            out.write(f"<{element}>\n")
-            out.write(text_elements[element])
-            out.write(f"\n</{element}>\n")
+class StageTimer:
+    __slots__ = ("stage_times", "stage", "within", "start")
+
+    def __init__(self, stage_times, stage, within=None):
+        self.stage_times = stage_times
+        self.stage = stage
+        self.within = within
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        self.stage_times[self.stage] += elapsed
+        if self.within is not None:
+            self.stage_times[self.within] -= elapsed
 
 '''
-text_elements is a dict containing text elements like 
-title, abstract, and body. Writes output in JSON
+Profiling counters for the parse pipeline: cumulative time per stage, 
+articles and bytes processed, and the top_n slowest articles. Stages 
+nest, so time in entities is also counted in cleanup. Body chunks 
+cleaned while parsing are counted in cleanup only. Stages are:
+    read: reading input files and tarball members
+    parse: the line loop or XML parser, including any I/O while parsing
+    cleanup: parse_abstract and parse_body, or finishing a stream parse
+    entities: remove_codes
+    write: writing output
+Worker processes keep their own stats and drain them to the parent 
+with each chunk
 '''
-def write_json(fp, text_elements):
-    with open(f"{fp}.json", "w") as out:
-        json.dump(text_elements, out)
+class PipelineStats:
+    enabled = True
+
+    def __init__(self, top_n=10, report_interval=60):
+        self.top_n = top_n
+        self.report_interval = report_interval
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+        self.reset()
+
+    def reset(self):
+        self.stage_times = defaultdict(float)
+        self.articles = 0
+        self.bytes = 0
+        # heap of (seconds, PMC ID), smallest first
+        self.slowest = []
+        # entity cache counts drained from workers
+        self.entity_hits = 0
+        self.entity_misses = 0
+
+    def timer(self, stage, within=None):
+        return StageTimer(self.stage_times, stage, within)
+
+    def add_article(self, pmc_id, size, seconds):
+        self.articles += 1
+        self.bytes += size
+        self.add_slow(seconds, pmc_id)
+
+    def add_slow(self, seconds, pmc_id):
+        if len(self.slowest) < self.top_n:
+            heapq.heappush(self.slowest, (seconds, pmc_id))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, pmc_id))
+
+    '''
+    Returns the counters as a dict and resets them, used by workers
+    '''
+    def drain(self):
+        snapshot = {"stage_times": dict(self.stage_times), "articles": self.articles,
+                    "bytes": self.bytes, "slowest": self.slowest, 
+                    "entity_hits": self.entity_hits + ENTITY_CACHE.hits, 
+                    "entity_misses": self.entity_misses + ENTITY_CACHE.misses}
+        self.reset()
+        ENTITY_CACHE.hits = 0
+        ENTITY_CACHE.misses = 0
+
+        return snapshot
+
+    def merge(self, snapshot):
+        if snapshot is None:
+            return
+
+        for stage, seconds in snapshot["stage_times"].items():
+            self.stage_times[stage] += seconds
+        self.articles += snapshot["articles"]
+        self.bytes += snapshot["bytes"]
+        for seconds, pmc_id in snapshot["slowest"]:
+            self.add_slow(seconds, pmc_id)
+        self.entity_hits += snapshot["entity_hits"]
+        self.entity_misses += snapshot["entity_misses"]
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start_time
 
+        return {"elapsed_seconds": elapsed,
+                "articles": self.articles,
+                "megabytes": self.bytes / 1e6,
+                "articles_per_second": self.articles / elapsed if elapsed else 0.0,
+                "megabytes_per_second": self.bytes / 1e6 / elapsed if elapsed else 0.0,
+                "stage_seconds": dict(self.stage_times),
+                "slowest": [{"pmc_id": pmc_id, "seconds": seconds} 
+                            for seconds, pmc_id in sorted(self.slowest, reverse=True)],
+                "entity_cache": {"hits": self.entity_hits + ENTITY_CACHE.hits,
+                                 "misses": self.entity_misses + ENTITY_CACHE.misses}}
+
+    '''
+    Logs throughput and stage times if report_interval seconds have 
+    passed since the last report
+    '''
+    def maybe_report(self, logger):
+        now = time.perf_counter()
+        if now - self.last_report < self.report_interval:
+            return
+
+        self.last_report = now
+        summary = self.summary()
+        stages = ", ".join([f"{stage}: {seconds:.1f}s" 
+                            for stage, seconds in summary["stage_seconds"].items()])
+        logger.info(f"{summary['articles']} articles, " \
+                    f"{summary['articles_per_second']:.1f} articles/s, " \
+                    f"{summary['megabytes_per_second']:.2f} MB/s, {stages}")
+
+'''
+Stand-in for PipelineStats when profiling is off, every method does 
+nothing
+'''
+class NullStats:
+    enabled = False
+    null_timer = nullcontext()
+
+    def timer(self, stage, within=None):
+        return self.null_timer
+
+    def add_article(self, pmc_id, size, seconds):
+        pass
+
+    def drain(self):
+        return None
+
+    def merge(self, snapshot):
+        pass
+
+    def maybe_report(self, logger):
+        pass
+
+STATS = NullStats()
+
+'''
+Turns profiling on for this process
 '''
-text_elements is a dict containing text elements like
-title, abstract, and body. Writes output in a plain text
+def enable_stats(top_n=10, report_interval=60):
+    global STATS
+    STATS = PipelineStats(top_n, report_interval)
+
+    return STATS
+
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+'''
+Returns a function that serializes an object to compact UTF-8 JSON 
+bytes, orjson.dumps if orjson is installed, otherwise the same output 
+from the json module
+'''
+def get_json_encoder():
+    try:
+        import orjson
+        return orjson.dumps
+    except ImportError:
+        return dumps_json
+
+def dumps_json(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+'''
+Raises ImportError if compression needs a package that isn't installed
+'''
+def check_compression(compression):
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unsupported compression: {compression}")
+
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard is required for zstd compression")
+
+'''
+Base for writers that write one file per article to output_dir, named 
+<PMC ID><extension>. Each article is serialized to bytes, compressed 
+if compression is "gzip" or "zstd", and written with a single write. 
+The JSON encoder and zstd compressor are set up on first use in each 
+process, so writers can be sent to worker processes
+'''
+class ArticleWriter:
+    extension = ""
+    bulk = False
+
+    def __init__(self, output_dir, compression=None, compresslevel=6):
+        check_compression(compression)
+
+        self.output_dir = output_dir
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.suffix = self.extension + COMPRESSION_EXTENSIONS[compression]
+        self.compressor = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["compressor"] = None
+
+        return state
+
+    def write(self, pmc_id, text_elements):
+        data = self.serialize(text_elements)
+
+        if self.compression == "gzip":
+            import gzip
+            data = gzip.compress(data, self.compresslevel, mtime=0)
+        elif self.compression == "zstd":
+            if self.compressor is None:
+                import zstandard
+                self.compressor = zstandard.ZstdCompressor(level=self.compresslevel)
+            data = self.compressor.compress(data)
+
+        with open(f"{self.output_dir}/{pmc_id}{self.suffix}", "wb") as out:
+            out.write(data)
+
+    def close(self):
+        pass
+
+'''
+Writes text elements like title, abstract, and body in an XML-like 
 format
 '''
-def write_plain_text(fp, text_elements):
-    with open(f"{fp}.txt", "w") as out:
-        for element in text_elements.keys():
-            out.write(f"{element.upper()}: {text_elements[element]}\n")
+class XMLWriter(ArticleWriter):
+    extension = ".xml"
+
+    def serialize(self, text_elements):
+        return "".join([f"<{element}>\n{text}\n</{element}>\n" 
+                        for element, text in text_elements.items()]).encode("utf-8")
+
+'''
+Writes text elements as a JSON object
+'''
+class JSONWriter(ArticleWriter):
+    extension = ".json"
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("dumps", None)
+
+        return state
+
+    def serialize(self, text_elements):
+        if not hasattr(self, "dumps"):
+            self.dumps = get_json_encoder()
+
+        return self.dumps(text_elements)
+
+'''
+Writes text elements in a plain text format, one "ELEMENT: text" line 
+per element
+'''
+class TextWriter(ArticleWriter):
+    extension = ".txt"
+
+    def serialize(self, text_elements):
+        return "".join([f"{element.upper()}: {text}\n" 
+                        for element, text in text_elements.items()]).encode("utf-8")
+
+'''
+Base for bulk writers that write records (the PMC ID and the text 
+elements) to rotating shard files in output_dir instead of one file 
+per article. A shard is written to a .tmp file and renamed when it 
+reaches shard_size bytes of uncompressed output or the writer is 
+closed. Numbering continues after any shards already in output_dir, 
+unless they are removed with remove_shards. Bulk writers run in the 
+parent process
+'''
+class ShardedWriter:
+    extension = ""
+    bulk = True
+    # compression get_output_function uses when none is requested
+    default_compression = None
+
+    def __init__(self, output_dir, shard_size=256 * 1024 * 1024, prefix="pmc"):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.shard_path = None
+        self.bytes_written = 0
+        # called after each shard is renamed into place
+        self.on_close_shard = None
+
+        self.shard_regex = re.compile(rf"^{re.escape(prefix)}-(\d+)" \
+                                      rf"{re.escape(self.extension)}(?:\.tmp)?$")
+        shard_indices = [int(self.shard_regex.search(f).group(1)) 
+                            for f in os.listdir(output_dir) 
+                            if self.shard_regex.search(f) and not f.endswith(".tmp")]
+        self.shard_index = max(shard_indices) + 1 if shard_indices else 0
+
+    '''
+    Removes the shards already in output_dir, and any left over .tmp 
+    shards, so numbering starts from 0. Returns the number removed
+    '''
+    def remove_shards(self):
+        shards = [f for f in os.listdir(self.output_dir) if self.shard_regex.search(f)]
+        for shard in shards:
+            os.remove(os.path.join(self.output_dir, shard))
+        self.shard_index = 0
+
+        return len(shards)
+
+    def write(self, pmc_id, text_elements):
+        if self.shard_path is None:
+            self.shard_path = os.path.join(self.output_dir, 
+                    f"{self.prefix}-{self.shard_index:05d}{self.extension}")
+            self.open_shard(f"{self.shard_path}.tmp", text_elements)
+
+        self.bytes_written += self.write_record(pmc_id, text_elements)
+
+        if self.bytes_written >= self.shard_size:
+            self.close_shard()
+
+    def close_shard(self):
+        self.finish_shard()
+        os.replace(f"{self.shard_path}.tmp", self.shard_path)
+        if self.on_close_shard is not None:
+            self.on_close_shard()
+
+        self.shard_path = None
+        self.shard_index += 1
+        self.bytes_written = 0
+
+    '''
+    Closes and removes the shard being written without renaming it into 
+    place, for runs that stop partway through
+    '''
+    def discard_shard(self):
+        if self.shard_path is not None:
+            self.finish_shard()
+            os.remove(f"{self.shard_path}.tmp")
+
+        self.shard_path = None
+        self.bytes_written = 0
+
+    def close(self):
+        if self.shard_path is not None:
+            self.close_shard()
+
+'''
+Writes records as JSON lines, one object per article with a pmc_id key 
+and a key for each text element. Shards are compressed with compression, 
+"gzip" or "zstd", or left uncompressed if it is None. Passing None to 
+get_output_function gives the default, gzip
+'''
+class ShardedJSONLWriter(ShardedWriter):
+    default_compression = "gzip"
+
+    def __init__(self, output_dir, shard_size=256 * 1024 * 1024, prefix="pmc", 
+            compression="gzip", compresslevel=6):
+        check_compression(compression)
+
+        self.extension = ".jsonl" + COMPRESSION_EXTENSIONS[compression]
+        self.compression = compression
+        self.compresslevel = compresslevel
+        self.dumps = get_json_encoder()
+        super().__init__(output_dir, shard_size, prefix)
+
+    def open_shard(self, fp, text_elements):
+        if self.compression == "gzip":
+            import gzip
+            self.handle = gzip.open(fp, "wb", compresslevel=self.compresslevel)
+        elif self.compression == "zstd":
+            import zstandard
+            compressor = zstandard.ZstdCompressor(level=self.compresslevel)
+            self.handle = compressor.stream_writer(open(fp, "wb"))
+        else:
+            self.handle = open(fp, "wb")
+
+    def write_record(self, pmc_id, text_elements):
+        record = {"pmc_id": pmc_id}
+        record.update(text_elements)
+        line = self.dumps(record) + b"\n"
+        self.handle.write(line)
+
+        return len(line)
+
+    def finish_shard(self):
+        self.handle.close()
+
+'''
+Writes records to Parquet files with a pmc_id column and a column for 
+each text element. Records are buffered and written as row groups of 
+row_group_size, compressed with compression, or uncompressed if it is 
+None. Passing None to get_output_function gives the default, zstd. 
+Requires pyarrow
+'''
+class ShardedParquetWriter(ShardedWriter):
+    extension = ".parquet"
+    default_compression = "zstd"
+
+    def __init__(self, output_dir, shard_size=256 * 1024 * 1024, prefix="pmc", 
+            compression="zstd", row_group_size=2048):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required for Parquet output")
+
+        self.pyarrow = pyarrow
+        self.compression = compression or "none"
+        self.row_group_size = row_group_size
+        super().__init__(output_dir, shard_size, prefix)
+
+    def open_shard(self, fp, text_elements):
+        self.columns = ["pmc_id"] + list(text_elements.keys())
+        schema = self.pyarrow.schema([(column, self.pyarrow.string()) 
+                                        for column in self.columns])
+        self.handle = self.pyarrow.parquet.ParquetWriter(fp, schema, 
+                compression=self.compression)
+        self.rows = {column: [] for column in self.columns}
+
+    def write_record(self, pmc_id, text_elements):
+        self.rows["pmc_id"].append(pmc_id)
+        size = len(pmc_id)
+        for column in self.columns[1:]:
+            self.rows[column].append(text_elements[column])
+            size += len(text_elements[column])
+
+        if len(self.rows["pmc_id"]) >= self.row_group_size:
+            self.write_row_group()
+
+        return size
+
+    def write_row_group(self):
+        if self.rows["pmc_id"]:
+            self.handle.write_table(self.pyarrow.table(self.rows))
+            self.rows = {column: [] for column in self.columns}
+
+    def finish_shard(self):
+        self.write_row_group()
+        self.handle.close()
 
 '''
 Takes an HTML entity and attempts to parse it into a UTF-8 
 character
 '''
 def parse_entity(match_obj):
-    logger = logging.getLogger(__name__)
     symbol = ""
     
     if match_obj.group(0):
@@ -54,6 +480,7 @@ def parse_entity(match_obj):
             symbol = unicodedata.normalize("NFKC", symbol)
         
         except Exception as e:
+            logger = logging.getLogger(__name__)
             trace = traceback.format_exc()
             logger.error(repr(e))
             logger.critical(trace)
@@ -62,22 +489,114 @@ def parse_entity(match_obj):
     return symbol
 
 '''
-Deal with HTML entity codes
+Bounded cache mapping HTML entities to the characters parse_entity 
+returns for them. Seeded with every HTML5 named entity, numeric 
+entities are decoded with parse_entity on the first occurrence and 
+added until the cache holds maxsize entries. Can be passed to re.sub 
+in place of parse_entity
 '''
-def remove_codes(string):
-    entity_regex = re.compile("&[^;\s]*;")
+class EntityCache:
+    seed_table = {f"&{name}": unicodedata.normalize("NFKC", value) 
+                    for name, value in html.entities.html5.items() 
+                    if name.endswith(";")}
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.table = dict(self.seed_table)
+        self.hits = 0
+        self.misses = 0
 
-    string = entity_regex.sub(parse_entity, string)
+    def __call__(self, match_obj):
+        entity = match_obj.group(0)
+        symbol = self.table.get(entity)
 
-    return string
+        if symbol is not None:
+            self.hits += 1
+            return symbol
+
+        self.misses += 1
+        symbol = parse_entity(match_obj)
+        if len(self.table) < self.maxsize:
+            self.table[entity] = symbol
+
+        return symbol
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.table)}
+
+ENTITY_CACHE = EntityCache()
+
+'''
+Compiled once at import. The body removals are grouped into a few passes 
+that give the same result as running them one after another:
+    - sup and td are matched in one pass, removing sups first cannot 
+      change where the greedy td match starts or ends
+    - th and LaTeX stay separate since their greedy matches depend on 
+      what the previous pass removed
+    - titles and labels are replaced with a marker in one pass, then the 
+      whitespace before each marker is stripped with str methods, which 
+      avoids a regex that has to be tried at every whitespace character
+DOTALL replaces joining the body into a single line, so whitespace 
+before body titles and labels is only removed up to the start of the line
+'''
+ENTITY_REGEX = re.compile(r"&[^;\s]*;")
+TAG_REGEX = re.compile(r"<[^>]+>")
+ABSTRACT_TITLE_REGEX = re.compile(r"<title>[^<]*</title>")
+BODY_SPAN_REGEXES = [re.compile(r"<sup[^<]*</sup>|<td.*</td>", re.DOTALL),
+                     re.compile(r"<th.*</th>", re.DOTALL),
+                     re.compile(r"\\documentclass\[.*\\end\{document\}", re.DOTALL)]
+BODY_TITLE_REGEX = re.compile(r"<(?:title>[^<]*</title>|label>[^<]*</label>)")
+MARKER = "\x00"
+
+TITLE_GROUP_START = re.compile(r"^\s*<title-group")
+TITLE_GROUP_STOP = re.compile(r"^\s*</title-group")
+TITLE_REGEX = re.compile(r"\s*<article-title>(.*)</article-title>")
+ABSTRACT_START = re.compile(r"\s*<abstract")
+ABSTRACT_STOP = re.compile(r"\s*</abstract>")
+BODY_START = re.compile(r"\s*<body")
+BODY_STOP = re.compile(r"\s*</body>")
+FRONT_STOP = re.compile(r"\s*</front>")
+
+SECTIONS = ("title", "abstract", "body")
+
+# Bodies are cleaned in chunks of about this many characters
+BODY_CHUNK_SIZE = 1 << 20
+# Elements the body span regexes remove across lines, a body chunk can 
+# only end where none of them are open
+SPAN_OPEN_REGEX = re.compile(r"<t[dh][\s>]|\\documentclass")
+SPAN_CLOSE_REGEX = re.compile(r"</t[dh]>|\\end\{document\}")
+
+'''
+Deal with HTML entity codes
+'''
+def remove_codes(string):
+    with STATS.timer("entities"):
+        return ENTITY_REGEX.sub(ENTITY_CACHE, string)
 
 '''
 Removes tags from a string
 '''
 def remove_tags(string):
-    tag_regex = re.compile("<[^>]+>")
+    return TAG_REGEX.sub("", string)
+
+'''
+Removes the elements matched by element_regex and the whitespace before 
+each of them. If keep_newlines, whitespace is only removed up to the 
+start of the line. XML cannot contain MARKER, so it is safe to split on
+'''
+def remove_elements(string, element_regex, keep_newlines=False):
+    pieces = element_regex.sub(MARKER, string).split(MARKER)
 
-    return tag_regex.sub("", string)
+    for index in range(len(pieces) - 1):
+        piece = pieces[index]
+        stripped = piece.rstrip()
+        if keep_newlines:
+            newline_index = piece.rfind("\n", len(stripped))
+            if newline_index >= 0:
+                stripped = piece[:newline_index + 1]
+        pieces[index] = stripped
+
+    return "".join(pieces)
 
 '''
 Removes empty lines. Currently also has logic to remove non-sentence 
@@ -87,19 +606,9 @@ whitespace-separated-elements)
 Note: this is all quite arbitrary
 '''
 def remove_empty_lines(string):
-    string = string.split("\n")
-    string = [line for line in string if re.search("\S", line)]
-    
-    for index, line in enumerate(string):
-        line = line.split()
-        if len(line) > 7:
-            string[index] = " ".join(line)
-        else:
-            string[index] = ""
+    lines = [line.split() for line in string.split("\n")]
 
-    string = [line for line in string if line]
-
-    return "\n".join(string)
+    return "\n".join([" ".join(line) for line in lines if len(line) > 7])
 
 
 '''
@@ -108,8 +617,8 @@ abstract should be a string, can contain tags and HTML entities
 returns a string without tags and HTML entities
 '''
 def parse_abstract(abstract):
-    # remove title
-    abstract = re.sub("\s*<title>[^<]*</title>", "", abstract)
+    # remove titles
+    abstract = remove_elements(abstract, ABSTRACT_TITLE_REGEX)
     
     # remove tags
     abstract = remove_tags(abstract)
@@ -128,23 +637,12 @@ body should be a string, can contain tags and HTML entities
 returns a string
 '''
 def parse_body(body):
-    # make one big block of text to make everything easier
-    body = "|$|$|".join(body.split("\n"))
-    
-    # remove text that is in tables
-    body = re.sub("<sup[^<]*</sup>", "", body)
-    body = re.sub("<td.*</td>", "", body)
-    body = re.sub("<th.*</th>", "", body)
+    # remove sups, text that is in tables, and LaTeX
+    for span_regex in BODY_SPAN_REGEXES:
+        body = span_regex.sub("", body)
 
-    # remove LaTeX
-    body = re.sub("\\\documentclass\[.*\\\end\{document\}", "", body)
-    # remove titles
-    body = re.sub("\s*<title>[^<]*</title>", "", body)
-
-    # remove figure labels
-    body = re.sub("\s*<label>[^<]*</label>", "", body)
-    
-    body = "\n".join(body.split("|$|$|"))
+    # remove titles and figure labels
+    body = remove_elements(body, BODY_TITLE_REGEX, keep_newlines=True)
 
     # remove tags
     body = remove_tags(body)
@@ -157,82 +655,750 @@ def parse_body(body):
     return body
 
 '''
-Parses a single PMC full text XML
+Raised when the text kept for an article goes over the max_chars limit 
+of a parse engine
 '''
-def parse_xml(fp):
+class ArticleTooLarge(Exception):
+    pass
+
+'''
+Cleans a body in chunks as its lines are added, so that only one chunk 
+of raw XML is held at a time instead of the whole body and its copies. 
+A chunk is cleaned once it has chunk_size characters and ends on a line 
+outside of any tag, table cell, or LaTeX document. Bodies smaller than 
+chunk_size are cleaned in one go by parse_body, in larger ones the 
+greedy table cell and LaTeX removals work within each chunk. If the raw 
+chunk and the cleaned text go over max_chars, ArticleTooLarge is raised
+'''
+class ChunkedBody:
+    def __init__(self, chunk_size=BODY_CHUNK_SIZE, max_chars=None):
+        self.chunk_size = chunk_size
+        self.max_chars = max_chars
+        self.lines = []
+        self.size = 0
+        self.balance = None
+        self.clean_pieces = []
+        self.clean_size = 0
+
+    def add(self, line):
+        self.lines.append(line)
+        self.size += len(line)
+
+        if self.max_chars is not None and self.size + self.clean_size > self.max_chars:
+            raise ArticleTooLarge(f"Body is over {self.max_chars} characters")
+
+        if self.size < self.chunk_size:
+            return
+
+        if self.balance is None:
+            self.balance = 0
+            for chunk_line in self.lines:
+                self.balance += self.span_balance(chunk_line)
+        else:
+            self.balance += self.span_balance(line)
+
+        if self.balance <= 0 and line.rfind("<") <= line.rfind(">"):
+            with STATS.timer("cleanup", within="parse"):
+                self.clean_chunk()
+
+    def span_balance(self, line):
+        return len(SPAN_OPEN_REGEX.findall(line)) - len(SPAN_CLOSE_REGEX.findall(line))
+
+    def clean_chunk(self):
+        clean = parse_body("".join(self.lines))
+        if clean:
+            self.clean_pieces.append(clean)
+            self.clean_size += len(clean)
+
+        self.lines = []
+        self.size = 0
+        self.balance = None
+
+    def finish(self):
+        if self.lines:
+            self.clean_chunk()
+
+        return "\n".join(self.clean_pieces)
+
+'''
+Opens a parse source, either a filepath or the contents of a file as 
+bytes. mode should be "r" or "rb"
+'''
+def open_source(source, mode="r"):
+    if isinstance(source, bytes):
+        handle = io.BytesIO(source)
+        if mode == "r":
+            handle = io.TextIOWrapper(handle, encoding="utf-8")
+        return handle
+
+    return open(source, mode)
+
+'''
+Reads the next line of an element, raises ValueError if the file ends 
+before the element does
+'''
+def read_line(handle, element):
+    line = handle.readline()
+    if not line:
+        raise ValueError(f"File ended inside {element}")
+
+    return line
+
+'''
+Parses a single PMC full text XML, fp can be a filepath or the 
+contents of the file as bytes. Only the requested sections are collected
+and cleaned, and reading stops once all of them have been read: the 
+title at the end of the first title group, abstracts at the end of the 
+front matter, and the body at its end tag. The body is cleaned in 
+chunks with ChunkedBody, and max_chars limits the size of the text kept 
+for it. Returns a dict of the requested sections. Errors are logged and 
+the sections are returned empty, unless raise_errors is set
+'''
+def parse_xml(fp, sections=SECTIONS, max_chars=None, chunk_size=BODY_CHUNK_SIZE, 
+        raise_errors=False):
     logger = logging.getLogger(__name__)
 
     title = ""
     clean_abstract = ""
     clean_body = ""
 
-    title_group_start = re.compile("^\s*<title-group")
-    title_group_stop = re.compile("^\s*</title-group")
-    title_regex = re.compile("\s*<article-title>(.*)</article-title>")
-
-    abstract_start = re.compile("\s*<abstract")
-    abstract_stop = re.compile("\s*</abstract>")
-
-    body_start = re.compile("\s*<body")
-    body_stop = re.compile("\s*</body>")
-
     abstract = []
-    body = []
+    body = ChunkedBody(chunk_size, max_chars)
+
+    remaining = set(sections)
 
     try:
-        with open(fp, "r") as handle:
+        with STATS.timer("parse"), open_source(fp, "r") as handle:
             line = handle.readline()
             logger.debug("starting line loop")
-            while line:
+            while line and remaining:
                 
-                if title_group_start.search(line):
+                if "title" in remaining and TITLE_GROUP_START.search(line):
                     logger.debug("found title group start tag")
-                    while not title_group_stop.search(line):
-                        if title_regex.search(line):
-                            title = title_regex.search(line).group(1)
-                        line = handle.readline()
+                    while not TITLE_GROUP_STOP.search(line):
+                        if TITLE_REGEX.search(line):
+                            title = TITLE_REGEX.search(line).group(1)
+                        line = read_line(handle, "title-group")
+                    remaining.discard("title")
                 
-                if abstract_start.search(line):
+                if "abstract" in remaining and ABSTRACT_START.search(line):
                     logger.debug("found abstract start tag")
-                    while not abstract_stop.search(line):
+                    while not ABSTRACT_STOP.search(line):
                         abstract.append(line)
-                        line = handle.readline()
+                        line = read_line(handle, "abstract")
+
+                if FRONT_STOP.search(line):
+                    remaining.discard("abstract")
 
-                if body_start.search(line):
+                if BODY_START.search(line):
+                    if "body" not in remaining:
+                        break
                     logger.debug("found body start tag")
-                    while not body_stop.search(line):
-                        body.append(line)
-                        line = handle.readline()
+                    while not BODY_STOP.search(line):
+                        body.add(line)
+                        line = read_line(handle, "body")
+                    break
 
                 line = handle.readline()
             logger.debug("end line loop")
-        clean_abstract = parse_abstract("".join(abstract))
-        clean_body = parse_body("".join(body))
 
+        with STATS.timer("cleanup"):
+            if "abstract" in sections:
+                clean_abstract = parse_abstract("".join(abstract))
+            if "body" in sections:
+                clean_body = body.finish()
+
+    except ArticleTooLarge:
+        raise
     except Exception as e:
+        if raise_errors:
+            raise
         trace = traceback.format_exc()
         logger.error(repr(e))
         logger.critical(trace)
 
-    title = remove_codes(title)
-    title = remove_tags(title)
+    if "title" in sections:
+        title = remove_codes(title)
+        title = remove_tags(title)
+
+    clean_text = {"title": title, "abstract": clean_abstract, "body": clean_body}
+
+    return {section: clean_text[section] for section in sections}
+
+'''
+Named HTML entities for the streaming engine. PMC XMLs declare a DTD 
+that expat does not load, so undeclared entities are resolved from this
+'''
+NAMED_ENTITIES = {name[:-1]: value for name, value in html.entities.html5.items() 
+                    if name.endswith(";")}
+
+'''
+Raised by ArticleTarget once all requested sections have been read
+'''
+class SectionsRead(Exception):
+    pass
+
+'''
+Parser target for the streaming engine. Receives start, end, and data 
+events from an XMLParser and keeps only the text of the title, abstract, 
+and body. The removals done with regexes by the line engine are done 
+here per element:
+    - in abstracts, titles without child elements are dropped
+    - in bodies, sup, title, and label elements without child elements 
+      are dropped, and td, th, and tex-math subtrees are skipped
+Like the line engine, whitespace on the same line before a dropped title 
+or label is removed (any whitespace for abstract titles). Non-ASCII text 
+is NFKC normalized, which matches remove_codes for PMC XMLs, where 
+non-ASCII characters are written as entities.
+
+Output differs from the line engine where its regexes over-match, which 
+benchmarks/compare_engines.py measures on a corpus:
+    - the td, th, and LaTeX removals of the line engine are greedy, so 
+      in a body with more than one table cell or formula everything from 
+      the first to the last is removed, text in between included. The 
+      stream engine removes only the elements themselves. This affects 
+      most articles with tables or more than one formula
+    - the line engine decodes entities in titles before removing tags, 
+      so escaped markup like &lt;i&gt; and any text between a &lt; and 
+      a &gt; is removed from the title. The stream engine keeps the 
+      decoded text
+    - where elements share a line with other text, removed whitespace 
+      can differ
+Articles without these give the same output with both engines, which 
+tests/test_parser.py checks on the articles in tests/fixtures/articles.
+
+Only the requested sections are collected. Once all of them have been 
+read, at the same points where the line engine stops, SectionsRead is 
+raised to stop the parser.
+
+Every chunk_size characters, the body lines that can no longer change 
+are cleaned and their raw text is let go, so memory stays bounded on 
+very large bodies. If the text kept goes over max_chars, ArticleTooLarge
+is raised
+'''
+class ArticleTarget:
+    skipped_subtrees = {"td", "th", "tex-math"}
+    leaf_drops = {"abstract": {"title": " \t\n\r\f\v"},
+                  "body": {"title": " \t\r\f\v", "label": " \t\r\f\v", 
+                           "sup": ""}}
+
+    def __init__(self, sections=SECTIONS, max_chars=None, chunk_size=BODY_CHUNK_SIZE):
+        self.sections = sections
+        self.remaining = set(sections)
+        self.max_chars = max_chars
+        self.chunk_size = chunk_size
+
+        self.title = ""
+        self.abstract = []
+        self.body = []
+
+        # cleaned body lines and the sizes of kept and cleaned text
+        self.clean_body = []
+        self.size = 0
+        self.clean_size = 0
+        self.flush_at = chunk_size
+
+        self.title_group_depth = 0
+        self.title_pieces = None
+
+        # section currently being collected and its text pieces
+        self.section = None
+        self.pieces = None
+        # one entry per open element in the section, [tag, start index, 
+        # is leaf] for elements that are dropped if they have no children
+        self.stack = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag == "title-group":
+            self.title_group_depth += 1
+        elif tag == "article-title" and self.title_group_depth and "title" in self.remaining:
+            self.title_pieces = []
+
+        if self.section is None:
+            if tag == "body" and "body" not in self.remaining:
+                raise SectionsRead()
+            elif tag in self.leaf_drops and tag in self.remaining:
+                self.section = tag
+                self.pieces = getattr(self, tag)
+                if self.pieces:
+                    self.pieces.append("\n")
+                self.stack.append(None)
+            return
 
-    return {"title": title, "abstract": clean_abstract, "body": clean_body}
+        if self.skip_depth or (self.section == "body" and tag in self.skipped_subtrees):
+            self.skip_depth += 1
+            return
+
+        if self.stack[-1] is not None:
+            self.stack[-1][2] = False
+
+        if tag in self.leaf_drops[self.section] and not (tag != "sup" and attrib):
+            self.stack.append([tag, len(self.pieces), True])
+        else:
+            self.stack.append(None)
+
+    def end(self, tag):
+        if tag == "title-group":
+            self.title_group_depth -= 1
+            if not self.title_group_depth:
+                self.finish_section("title")
+        elif tag == "article-title" and self.title_pieces is not None:
+            self.title = "".join(self.title_pieces)
+            self.title_pieces = None
+        elif tag == "front":
+            self.finish_section("abstract")
+
+        if self.section is None:
+            return
+
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+
+        entry = self.stack.pop()
+        if entry is not None and entry[2]:
+            del self.pieces[entry[1]:]
+            strip_chars = self.leaf_drops[self.section][entry[0]]
+            if strip_chars:
+                rstrip_pieces(self.pieces, strip_chars)
+
+        if not self.stack:
+            if self.section == "body":
+                self.finish_section("body")
+            self.section = None
+            self.pieces = None
+
+    def data(self, text):
+        if not text.isascii():
+            text = unicodedata.normalize("NFKC", text)
+
+        if self.title_pieces is not None:
+            self.title_pieces.append(text)
+
+        if self.pieces is not None and not self.skip_depth:
+            self.pieces.append(text)
+            self.size += len(text)
+
+            if self.max_chars is not None and self.size + self.clean_size > self.max_chars:
+                raise ArticleTooLarge(f"Article text is over {self.max_chars} characters")
+            if self.section == "body" and self.size >= self.flush_at:
+                self.flush_body()
+
+    '''
+    Cleans the body up to its last newline before any open element that 
+    may still be dropped, and replaces that text with the cleaned lines
+    '''
+    def flush_body(self):
+        limit = len(self.pieces)
+        for entry in self.stack:
+            if entry is not None and entry[2]:
+                limit = entry[1]
+                break
+
+        text = "".join(self.pieces[:limit])
+        end = text.rfind("\n") + 1
+
+        if end:
+            with STATS.timer("cleanup", within="parse"):
+                clean = remove_empty_lines(text[:end])
+            if clean:
+                self.clean_body.append(clean)
+                self.clean_size += len(clean)
+
+            rest = self.pieces[limit:]
+            shift = limit
+            if end < len(text):
+                rest.insert(0, text[end:])
+                shift -= 1
+            for entry in self.stack:
+                if entry is not None:
+                    entry[1] -= shift
+
+            self.body = self.pieces = rest
+            self.size = sum(map(len, self.abstract)) + sum(map(len, self.body))
+
+        self.flush_at = self.size + self.chunk_size
+
+    def finish_section(self, section):
+        self.remaining.discard(section)
+        if not self.remaining:
+            raise SectionsRead()
+
+    '''
+    Returns a dict of the requested sections
+    '''
+    def result(self):
+        clean_text = {"title": self.title, "abstract": "", "body": ""}
+        if "abstract" in self.sections:
+            clean_text["abstract"] = remove_empty_lines("".join(self.abstract))
+        if "body" in self.sections:
+            clean_body = self.clean_body + [remove_empty_lines("".join(self.body))]
+            clean_text["body"] = "\n".join([clean for clean in clean_body if clean])
+
+        return {section: clean_text[section] for section in self.sections}
+
+'''
+Removes trailing characters in strip_chars from a list of text pieces
+'''
+def rstrip_pieces(pieces, strip_chars):
+    while pieces:
+        stripped = pieces[-1].rstrip(strip_chars)
+        if stripped:
+            pieces[-1] = stripped
+            return
+        pieces.pop()
+
+'''
+Parses a single PMC full text XML with the streaming engine, fp can be 
+a filepath or the contents of the file as bytes. The file is fed to an 
+XMLParser in blocks and only the text of the requested sections is 
+kept. Reading stops once the target has all of them. max_chars limits 
+the size of the text kept for the article. Errors are handled like in 
+parse_xml
+'''
+def parse_xml_stream(fp, block_size=1 << 16, sections=SECTIONS, max_chars=None, 
+        chunk_size=BODY_CHUNK_SIZE, raise_errors=False):
+    logger = logging.getLogger(__name__)
+
+    import xml.etree.ElementTree as ET
+
+    target = ArticleTarget(sections, max_chars, chunk_size)
+    xml_parser = ET.XMLParser(target=target)
+    xml_parser.entity.update(NAMED_ENTITIES)
+
+    try:
+        try:
+            with STATS.timer("parse"), open_source(fp, "rb") as handle:
+                block = handle.read(block_size)
+                while block:
+                    xml_parser.feed(block)
+                    block = handle.read(block_size)
+                xml_parser.close()
+        except SectionsRead:
+            pass
+
+        with STATS.timer("cleanup"):
+            return target.result()
+
+    except ArticleTooLarge:
+        raise
+    except Exception as e:
+        if raise_errors:
+            raise
+        trace = traceback.format_exc()
+        logger.error(repr(e))
+        logger.critical(trace)
+
+    target.abstract = []
+    target.body = []
+
+    return target.result()
+
+'''
+Yields absolute filepaths for files in a directory as they are found 
+with os.scandir. If recursive, subdirectories are walked as well, as in 
+oa_package/xx/yy/ trees. extensions can be a tuple of file name endings 
+to keep. allow_list can be a set of PMC IDs, files named PMCxxxx.* are 
+kept only if their PMC ID is in it
+'''
+def iter_input_files(directory, recursive=False, extensions=None, allow_list=None):
+    directories = [os.path.realpath(directory)]
+
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        directories.append(entry.path)
+                    continue
+
+                if not entry.is_file():
+                    continue
+                if extensions and not entry.name.endswith(extensions):
+                    continue
+                if allow_list is not None and PMC_FILE_REGEX.search(entry.name):
+                    if get_pmc_id(entry.name) not in allow_list:
+                        continue
+
+                yield entry.path
 
 '''
 returns a list of absolute filepaths for every file in a directory
 '''
 def get_file_list(directory):
-    absolute_path = Path(directory).resolve()
-    files = os.listdir(directory)
-    absolute_fps = [os.path.join(absolute_path, f) for f in files]
+    return list(iter_input_files(directory))
 
-    return [fp for fp in absolute_fps if os.path.isfile(fp)]
+'''
+Returns "PMC" followed by the digits of a PMC ID given with or without
+the prefix
+'''
+def normalize_pmc_id(pmc_id):
+    pmc_id = pmc_id.strip()
+    if pmc_id.upper().startswith("PMC"):
+        pmc_id = pmc_id[3:]
+
+    return f"PMC{pmc_id}"
 
 '''
-returns a logger
+Reads a file with one PMC ID per line, like specialized_articles, into 
+a set of normalized PMC IDs
+'''
+def load_allow_list(fp):
+    allow_list = set()
+    with open(fp, "r") as handle:
+        for line in handle:
+            if line.strip():
+                allow_list.add(normalize_pmc_id(line))
+
+    return allow_list
+
+TARBALL_EXTENSIONS = (".tar.gz", ".tgz", ".tar")
+XML_EXTENSIONS = (".nxml", ".xml")
+OA_PACKAGE_REGEX = re.compile(r"^(PMC\d+)\.tar\.gz$")
+PMC_FILE_REGEX = re.compile(r"^PMC\d+\.")
+
+'''
+Returns the PMC ID for an input file, the file name up to the first "."
+'''
+def get_pmc_id(fp):
+    return os.path.basename(fp).split(".")[0]
+
+'''
+Yields (PMC ID, XML bytes) for each XML in a tarball, reading the 
+tarball as a stream without extracting anything to disk. oa_package 
+tarballs (PMCxxxx.tar.gz) are named by their PMC ID and only their 
+.nxml article is read, other XMLs in them are supplementary material. 
+For bulk archives like oa_comm_xml.*.tar.gz each XML is named by its 
+file name. If allow_list is passed, XMLs with other PMC IDs are skipped. 
+fp can also be the tarball as bytes, in which case name gives its file 
+name. Read errors are logged, or raised if raise_errors is set
+'''
+def iter_tarball(fp, allow_list=None, name=None, raise_errors=False):
+    import tarfile
+
+    logger = logging.getLogger(__name__)
+
+    if name is None:
+        name = fp
+    package_match = OA_PACKAGE_REGEX.search(os.path.basename(name))
+    if package_match and allow_list is not None and package_match.group(1) not in allow_list:
+        return
+
+    try:
+        with open_source(fp, "rb") as handle, \
+                tarfile.open(fileobj=handle, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+
+                if package_match:
+                    if not member.name.endswith(".nxml"):
+                        continue
+                    pmc_id = package_match.group(1)
+                elif member.name.endswith(XML_EXTENSIONS):
+                    pmc_id = get_pmc_id(member.name)
+                    if allow_list is not None and pmc_id not in allow_list:
+                        continue
+                else:
+                    continue
+
+                with STATS.timer("read"):
+                    source = tar.extractfile(member).read()
+
+                yield pmc_id, source
+
+                if package_match:
+                    return
+
+    except (tarfile.TarError, OSError, EOFError) as e:
+        if raise_errors:
+            raise
+        logger.error(f"Could not read tarball {name}: {repr(e)}")
+
+'''
+Source for an input that could not be read, processed as a failure so 
+that the input is not marked complete
+'''
+class SourceReadError:
+    def __init__(self, message):
+        self.message = message
+
+'''
+Returns the size, mtime, and BLAKE2 hash of a file
+'''
+def file_fingerprint(fp, block_size=1 << 20):
+    import hashlib
+
+    stat = os.stat(fp)
+    file_hash = hashlib.blake2b(digest_size=20)
+
+    with open(fp, "rb") as handle:
+        block = handle.read(block_size)
+        while block:
+            file_hash.update(block)
+            block = handle.read(block_size)
+
+    return {"path": fp, "size": stat.st_size, "mtime": stat.st_mtime_ns, 
+            "hash": file_hash.hexdigest()}
+
 '''
-def initialize_logger(debug=False, quiet=False):
+Manifest of completed inputs, kept as manifest.jsonl in the output 
+directory. The first line holds the run settings, each following line 
+the path, size, mtime, and hash of an input whose output has been 
+written. Later lines for a path replace earlier ones. An input is 
+skipped if its size and mtime are unchanged, or if they changed but 
+its hash did not. If the settings differ from the manifest's, or force 
+is set, the manifest is started over and every input is processed.
+
+If defer is set, completed inputs are held until commit is called, 
+which bulk writers do once the shard holding their records is closed
+'''
+class Manifest:
+    def __init__(self, output_dir, settings, force=False, defer=False):
+        logger = logging.getLogger(__name__)
+
+        self.path = os.path.join(output_dir, "manifest.jsonl")
+        self.settings = settings
+        self.defer = defer
+        self.entries = {}
+        self.in_progress = {}
+        self.pending = []
+        # set if the manifest was started over, output from earlier runs 
+        # is no longer accounted for
+        self.reset = False
+
+        if not force and os.path.isfile(self.path):
+            self.load()
+            if self.entries is None:
+                logger.info("Settings differ from the manifest, processing all inputs")
+
+        if force or self.entries is None or not os.path.isfile(self.path):
+            self.entries = {}
+            self.reset = True
+            with open(self.path, "w") as out:
+                out.write(json.dumps({"settings": settings}))
+                out.write("\n")
+        else:
+            logger.info(f"Loaded manifest with {len(self.entries)} completed inputs")
+
+        self.handle = open(self.path, "a")
+
+    '''
+    Loads entries, sets entries to None if the settings do not match. A 
+    partly written last line from an interrupted run is ignored
+    '''
+    def load(self):
+        with open(self.path, "r") as handle:
+            for index, line in enumerate(handle):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if index == 0:
+                    if record.get("settings") != self.settings:
+                        self.entries = None
+                        return
+                else:
+                    self.entries[record["path"]] = record
+
+    '''
+    Returns True if fp has to be processed. Unchanged inputs with a new 
+    mtime get an updated entry. Only inputs with an entry are hashed 
+    here, new inputs are hashed when they are completed, in the worker 
+    for loose files
+    '''
+    def needs_processing(self, fp):
+        entry = self.entries.get(fp)
+        if entry is None:
+            self.in_progress[fp] = None
+            return True
+
+        stat = os.stat(fp)
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return False
+
+        fingerprint = file_fingerprint(fp)
+        if entry["hash"] == fingerprint["hash"]:
+            self.write_entries([fingerprint])
+            return False
+
+        self.in_progress[fp] = fingerprint
+
+        return True
+
+    '''
+    Records fp as completed, with fingerprint if it was computed by a 
+    worker
+    '''
+    def complete(self, fp, fingerprint=None):
+        entry = self.in_progress.pop(fp) or fingerprint or file_fingerprint(fp)
+        if self.defer:
+            self.pending.append(entry)
+        else:
+            self.write_entries([entry])
+
+    def commit(self):
+        self.write_entries(self.pending)
+        self.pending = []
+
+    def discard(self):
+        self.pending = []
+
+    def write_entries(self, entries):
+        for entry in entries:
+            self.entries[entry["path"]] = entry
+            self.handle.write(json.dumps(entry))
+            self.handle.write("\n")
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+'''
+Yields (PMC ID, source, input file) for every input, where source is a 
+filepath for loose XML files or bytes for XMLs read from tarballs. 
+input_path can be a directory or a single file, directories are read 
+lazily with iter_input_files. If a manifest is passed, inputs it has 
+as unchanged are skipped. A tarball that fails partway through yields 
+a SourceReadError after the articles read before the error
+'''
+def iter_sources(input_path, manifest=None, recursive=False, extensions=None, 
+        allow_list=None):
+    if os.path.isfile(input_path):
+        input_files = [os.path.realpath(input_path)]
+    else:
+        input_files = iter_input_files(input_path, recursive, extensions, allow_list)
+
+    for input_file in input_files:
+        if manifest is not None and not manifest.needs_processing(input_file):
+            continue
+
+        if input_file.endswith(TARBALL_EXTENSIONS):
+            import tarfile
+
+            try:
+                for pmc_id, source in iter_tarball(input_file, allow_list, 
+                                                   raise_errors=True):
+                    yield pmc_id, source, input_file
+            except (tarfile.TarError, OSError, EOFError) as e:
+                yield get_pmc_id(input_file), SourceReadError(
+                        f"Could not read tarball {input_file}: {repr(e)}"), input_file
+        else:
+            yield get_pmc_id(input_file), input_file, input_file
+
+# names of the handlers initialize_logger adds
+LOG_HANDLER_NAMES = ("pmc-parser-file", "pmc-parser-stdout")
+
+'''
+returns a logger. Handlers added by a previous call are replaced, so it 
+can be called any number of times in one process without duplicating 
+log lines. The log file is opened when the first record is written, and 
+is not used if log_file is empty. Console logging goes to stream, stdout 
+by default
+'''
+def initialize_logger(debug=False, quiet=False, log_file="pmc-parser.log", stream=None):
     level = logging.INFO
     if debug:
         level = logging.DEBUG
@@ -240,13 +1406,21 @@ def initialize_logger(debug=False, quiet=False):
     # Set up logging
     logger = logging.getLogger(__name__)
     logger.setLevel(level)
-    handler = logging.FileHandler("pmc-parser.log")
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    for handler in list(logger.handlers):
+        if handler.get_name() in LOG_HANDLER_NAMES:
+            logger.removeHandler(handler)
+            handler.close()
+
+    if log_file:
+        handler = logging.FileHandler(log_file, delay=True)
+        handler.set_name("pmc-parser-file")
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
 
     if not quiet:
-        handler = logging.StreamHandler(sys.stdout)
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.set_name("pmc-parser-stdout")
         handler.setLevel(level)
         formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
         handler.setFormatter(formatter)
@@ -260,8 +1434,7 @@ Validates the section names requested in the input
 def validate_sections(sections_in):
     logger = logging.getLogger(__name__)
 
-    valid_sections = ["title", "abstract", "body"]
-    sections = [sec for sec in sections_in if sec in valid_sections]
+    sections = [sec for sec in sections_in if sec in SECTIONS]
     
     if len(sections) == 0:
         raise ValueError("No valid text sections were passed")
@@ -273,61 +1446,554 @@ def validate_sections(sections_in):
     return sections
 
 '''
-Maps the output format string to a function
+Maps the output format string to a writer for output_dir. Writers have 
+write(pmc_id, text_elements) and close() methods. xml, json, and text 
+write one file per article, jsonl and parquet are bulk writers that 
+write shards of shard_size MB. compression can be "gzip" or "zstd", if 
+it is None bulk writers use their default compression
 '''
-def get_output_function(output_format):
+def get_output_function(output_format, output_dir, compression=None, shard_size=256):
     logger = logging.getLogger(__name__)
 
-    function_map = {"xml": write_xml,
-                    "json": write_json,
-                    "text": write_plain_text}
+    writer_map = {"xml": XMLWriter,
+                  "json": JSONWriter,
+                  "text": TextWriter,
+                  "jsonl": ShardedJSONLWriter,
+                  "parquet": ShardedParquetWriter}
 
-    if output_format not in function_map.keys():
+    if output_format not in writer_map.keys():
         logger.warning("Requested output format not supported, defaulting to XML")
         output_format = "xml"
 
-    return function_map[output_format]
+    writer_class = writer_map[output_format]
+    if writer_class.bulk:
+        if compression is None:
+            compression = writer_class.default_compression
+        return writer_class(output_dir, shard_size * 1024 * 1024, compression=compression)
+
+    return writer_class(output_dir, compression)
+
+'''
+Maps the engine name to a parse function. If max_chars is set, articles 
+with more text than that raise ArticleTooLarge. If raise_errors is set, 
+articles that cannot be parsed raise instead of returning empty sections
+'''
+def get_parse_function(engine, max_chars=None, raise_errors=False):
+    logger = logging.getLogger(__name__)
+
+    function_map = {"line": parse_xml,
+                    "stream": parse_xml_stream}
+
+    if engine not in function_map.keys():
+        logger.warning("Requested engine not supported, defaulting to line")
+        engine = "line"
+
+    options = {}
+    if max_chars is not None:
+        options["max_chars"] = max_chars
+    if raise_errors:
+        options["raise_errors"] = True
+    if options:
+        return partial(function_map[engine], **options)
+
+    return function_map[engine]
+
+'''
+Parses a single source and writes the requested sections with the 
+writer output_function. If output_function is None nothing is written 
+and the sections are returned for a bulk writer
+'''
+def process_file(pmc_id, source, output_function, sections, parse_function=parse_xml):
+    if STATS.enabled:
+        start = time.perf_counter()
+        if not isinstance(source, bytes):
+            with STATS.timer("read"), open(source, "rb") as handle:
+                source = handle.read()
+
+    clean_text = parse_function(source, sections=sections)
+
+    if output_function is not None:
+        with STATS.timer("write"):
+            output_function.write(pmc_id, clean_text)
+        clean_text = None
+
+    if STATS.enabled:
+        STATS.add_article(pmc_id, len(source), time.perf_counter() - start)
+
+    return clean_text
+
+'''
+Runs process_file over a chunk of items from iter_sources. Exceptions 
+and sources that could not be read are returned as errors with the 
+results so that the parent can log them. With fingerprint_inputs, loose 
+input files are also fingerprinted for the manifest here rather than in 
+the parent. Returns the results and this process's drained stats
+'''
+def process_chunk(sources, output_function, sections, parse_function=parse_xml, 
+        fingerprint_inputs=False):
+    results = []
+    for pmc_id, source, input_file in sources:
+        if isinstance(source, SourceReadError):
+            results.append((pmc_id, input_file, None, source.message, None))
+            continue
+
+        try:
+            clean_text = process_file(pmc_id, source, output_function, sections, 
+                    parse_function)
+            fingerprint = None
+            if fingerprint_inputs and source == input_file:
+                fingerprint = file_fingerprint(input_file)
+            results.append((pmc_id, input_file, clean_text, None, fingerprint))
+        except Exception as e:
+            results.append((pmc_id, input_file, None, traceback.format_exc(), None))
+
+    return results, STATS.drain()
+
+'''
+Worker process initializer, sends all log records back to the parent 
+process through log_queue
+'''
+def initialize_worker(log_queue, level, stats_enabled=False):
+    from logging.handlers import QueueHandler
+
+    logger = logging.getLogger(__name__)
+    logger.handlers = []
+    logger.setLevel(level)
+    logger.addHandler(QueueHandler(log_queue))
+
+    if stats_enabled:
+        enable_stats()
+
+'''
+Yields lists of up to chunk_size items from an iterable
+'''
+def chunked(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+'''
+Handles the results of processed chunks in submission order. Logs 
+errors, passes returned sections to the bulk writer if there is one, 
+and marks an input complete in the manifest once all of its results 
+have been handled without errors
+'''
+class ResultHandler:
+    def __init__(self, bulk_writer=None, manifest=None):
+        self.bulk_writer = bulk_writer
+        self.manifest = manifest
+        self.current_input = None
+        self.current_failed = False
+        self.current_fingerprint = None
+
+    def handle(self, chunk_output):
+        logger = logging.getLogger(__name__)
+
+        results, stats = chunk_output
+        STATS.merge(stats)
+
+        for pmc_id, input_file, clean_text, trace, fingerprint in results:
+            if input_file != self.current_input:
+                self.finish_input()
+                self.current_input = input_file
+            if fingerprint is not None:
+                self.current_fingerprint = fingerprint
+
+            if trace:
+                self.current_failed = True
+                logger.error(f"Failed to process {pmc_id}")
+                logger.critical(trace)
+            else:
+                if self.bulk_writer is not None:
+                    with STATS.timer("write"):
+                        self.bulk_writer.write(pmc_id, clean_text)
+                logger.debug(f"Processed {pmc_id}")
+
+        STATS.maybe_report(logger)
+
+    def finish_input(self):
+        if self.manifest is not None and self.current_input is not None:
+            if self.current_failed:
+                self.manifest.in_progress.pop(self.current_input, None)
+            else:
+                self.manifest.complete(self.current_input, self.current_fingerprint)
+
+        self.current_input = None
+        self.current_failed = False
+        self.current_fingerprint = None
+
+    '''
+    Drops the input being handled without marking it complete, for runs 
+    that stop partway through an input. It is processed again on the 
+    next run
+    '''
+    def abandon_input(self):
+        if self.manifest is not None and self.current_input is not None:
+            self.manifest.in_progress.pop(self.current_input, None)
+
+        self.current_input = None
+        self.current_failed = False
+        self.current_fingerprint = None
+
+'''
+Spreads the parse loop across a pool of worker processes. Sources are 
+submitted in chunks and at most 2 * workers chunks are in flight at 
+once. Results are collected in submission order, so logging and bulk 
+output are stable between runs
+'''
+def parse_parallel(sources, output_function, sections, workers, chunk_size=64, 
+        parse_function=parse_xml, result_handler=None, fingerprint_inputs=False):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from logging.handlers import QueueListener
+
+    logger = logging.getLogger(__name__)
+
+    log_queue = multiprocessing.Queue()
+    listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
+
+    task = partial(process_chunk, output_function=output_function, sections=sections, 
+            parse_function=parse_function, fingerprint_inputs=fingerprint_inputs)
+    if result_handler is None:
+        result_handler = ResultHandler()
+    pending = deque()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                initargs=(log_queue, logger.level, STATS.enabled)) as executor:
+            for chunk in chunked(sources, chunk_size):
+                pending.append(executor.submit(task, chunk))
+                if len(pending) >= 2 * workers:
+                    result_handler.handle(pending.popleft().result())
+
+            while pending:
+                result_handler.handle(pending.popleft().result())
+    finally:
+        listener.stop()
+
+'''
+Parses sources, (PMC ID, source, key) tuples like those from 
+iter_sources, and writes them in output_format. Sources can come from 
+any iterable, for example a queue of downloads. If a manifest is passed,
+keys are input files and are marked complete in it once parsed. If the 
+manifest was started over, bulk shards from earlier runs are removed so 
+articles are not written twice. Articles with more than 
+max_article_size MB of text fail instead of being parsed
+'''
+def parse_sources(sources, output_dir, output_format="xml", 
+        sections=["title", "abstract", "body"], workers=1, chunk_size=64, 
+        engine="line", shard_size=256, manifest=None, max_article_size=None,
+        compression=None):
+    logger = logging.getLogger(__name__)
+
+    writer = get_output_function(output_format, output_dir, compression, shard_size)
+    bulk_writer = None
+    output_function = writer
+    if writer.bulk:
+        bulk_writer = writer
+        output_function = None
+    max_chars = None
+    if max_article_size:
+        max_chars = int(max_article_size * 1024 * 1024)
+    parse_function = get_parse_function(engine, max_chars)
+
+    if bulk_writer is not None and manifest is not None:
+        if manifest.reset:
+            removed = bulk_writer.remove_shards()
+            if removed:
+                logger.warning(f"Manifest was started over, removed {removed} shards " \
+                               f"from earlier runs in {output_dir}")
+        manifest.defer = True
+        bulk_writer.on_close_shard = manifest.commit
+    result_handler = ResultHandler(bulk_writer, manifest)
+    fingerprint_inputs = manifest is not None
+
+    try:
+        if workers > 1:
+            logger.debug(f"Starting parallel parse loop with {workers} workers")
+            parse_parallel(sources, output_function, sections, workers, chunk_size, 
+                    parse_function, result_handler, fingerprint_inputs)
+        else:
+            logger.debug("Starting parse loop")
+            for chunk in chunked(sources, 1):
+                result_handler.handle(process_chunk(chunk, output_function, sections, 
+                        parse_function, fingerprint_inputs))
+            logger.debug(f"Entity cache: {ENTITY_CACHE.stats()}")
+        result_handler.finish_input()
+    except BaseException:
+        result_handler.abandon_input()
+        if bulk_writer is not None and manifest is not None:
+            # inputs in the open shard are not in the manifest yet and are 
+            # processed again on the next run, so the shard is dropped
+            bulk_writer.discard_shard()
+            manifest.discard()
+        raise
+    finally:
+        writer.close()
 
 '''
 Main driver function
 '''
 def parse_xmls(input_dir, output_dir, output_format="xml", 
-        sections=["title", "abstract", "body"], quiet=False, debug=False):
-    logger = initialize_logger(debug, quiet)
+        sections=["title", "abstract", "body"], quiet=False, debug=False,
+        workers=1, chunk_size=64, engine="line", shard_size=256, force=False,
+        recursive=False, extensions=None, allow_list_fp=None, stats=False,
+        stats_interval=60, max_article_size=None, compression=None, 
+        log_file="pmc-parser.log"):
+    logger = initialize_logger(debug, quiet, log_file)
+
+    if stats:
+        enable_stats(report_interval=stats_interval)
 
     sections = validate_sections(sections)
     
 
     logger.info(f"Starting parser, input dir: {input_dir}, output dir: {output_dir}")
-    logger.debug("Getting file list")
-    
-    input_files = get_file_list(input_dir)
 
-    output_function = get_output_function(output_format)
-    
-    logger.debug("Starting parse loop")
-    for input_file in input_files:
-        clean_text_temp = parse_xml(input_file)
-        
-        clean_text = {}
-        for section in sections:
-            clean_text[section] = clean_text_temp[section]
+    settings = {"sections": sections, "output_format": output_format, "engine": engine}
+    if compression:
+        settings["compression"] = compression
+
+    allow_list = None
+    if allow_list_fp:
+        allow_list = load_allow_list(allow_list_fp)
+        logger.info(f"Loaded allow list with {len(allow_list)} PMC IDs")
+        import hashlib
+        allow_list_hash = hashlib.blake2b("\n".join(sorted(allow_list)).encode(), 
+                digest_size=20)
+        settings["allow_list"] = allow_list_hash.hexdigest()
+    manifest = Manifest(output_dir, settings, force)
+
+    if extensions:
+        extensions = tuple(extensions)
+    sources = iter_sources(input_dir, manifest, recursive, extensions, allow_list)
 
-        pmc_id = input_file.split("/")[-1].split(".")[0]    
-        output_function(f"{output_dir}/{pmc_id}", clean_text)
+    try:
+        parse_sources(sources, output_dir, output_format, sections, workers, chunk_size, 
+                engine, shard_size, manifest, max_article_size, compression)
+    finally:
+        manifest.close()
+
+    if STATS.enabled:
+        summary = STATS.summary()
+        with open(os.path.join(output_dir, "parser-stats.json"), "w") as out:
+            json.dump(summary, out, indent=2)
+        logger.info(f"Parsed {summary['articles']} articles in " \
+                    f"{summary['elapsed_seconds']:.1f}s, stats written to " \
+                    f"{output_dir}/parser-stats.json")
         
+'''
+Parser for use as a library in long running processes. The section 
+list, parse function, and writer are set up once, and articles are 
+parsed from memory or from files with no per call setup. Compiled 
+patterns and the entity cache are shared by every parser in a process.
+
+If output_format is set, every parsed article is also written to 
+output_dir with that format's writer, which is closed by close(). 
+Articles with more than max_article_size MB of text raise 
+ArticleTooLarge. Log records go to logger, by default this module's 
+logger, which PMCParser does not configure
+'''
+class PMCParser:
+    def __init__(self, sections=SECTIONS, engine="line", output_format=None, 
+                 output_dir=None, compression=None, shard_size=256, 
+                 max_article_size=None, logger=None):
+        self.sections = tuple(validate_sections(sections))
+        self.logger = logger or logging.getLogger(__name__)
+        self.entity_cache = ENTITY_CACHE
+
+        max_chars = None
+        if max_article_size:
+            max_chars = int(max_article_size * 1024 * 1024)
+        self.parse_function = get_parse_function(engine, max_chars, raise_errors=True)
+
+        self.writer = None
+        if output_format is not None:
+            if output_dir is None:
+                raise ValueError("output_dir is needed to write output")
+            self.writer = get_output_function(output_format, output_dir, compression, 
+                                              shard_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    '''
+    Parses an article from source, a filepath or the contents of its XML 
+    as bytes, returns a dict of the requested sections. Articles that 
+    cannot be read or parsed raise. With a writer, pmc_id is needed and 
+    the sections are also written
+    '''
+    def parse(self, source, pmc_id=None):
+        clean_text = self.parse_function(source, sections=self.sections)
+
+        if self.writer is not None:
+            if pmc_id is None:
+                raise ValueError("pmc_id is needed to write output")
+            with STATS.timer("write"):
+                self.writer.write(pmc_id, clean_text)
+
+        return clean_text
+
+    '''
+    Parses an article from the contents of its XML, without touching the 
+    filesystem unless there is a writer
+    '''
+    def parse_bytes(self, data, pmc_id=None):
+        return self.parse(bytes(data), pmc_id)
+
+    '''
+    Parses an article from a filepath, pmc_id defaults to the one in the 
+    file name
+    '''
+    def parse_file(self, fp, pmc_id=None):
+        if pmc_id is None:
+            pmc_id = get_pmc_id(fp)
+
+        return self.parse(str(fp), pmc_id)
+
+    '''
+    Parses sources lazily, yielding (PMC ID, sections) for each. Sources 
+    are (PMC ID, source) pairs or (PMC ID, source, key) tuples like those 
+    from iter_sources and iter_tarball, where source is a filepath or 
+    bytes. Articles that cannot be read or parsed, or are too large, are 
+    logged and yielded with None
+    '''
+    def parse_many(self, sources):
+        for pmc_id, source, *_ in sources:
+            if isinstance(source, SourceReadError):
+                self.logger.error(source.message)
+                yield pmc_id, None
+                continue
+
+            try:
+                clean_text = self.parse(source, pmc_id)
+            except Exception:
+                self.logger.error(f"Failed to process {pmc_id}")
+                self.logger.critical(traceback.format_exc())
+                clean_text = None
+            else:
+                self.logger.debug(f"Processed {pmc_id}")
+
+            yield pmc_id, clean_text
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+'''
+Handles a server request, a line holding an input path: an XML, a 
+tarball, or a directory of them. Returns the response, a JSON line with 
+the input and the number of articles parsed and failed, or an error
+'''
+def handle_request(pmc_parser, line, recursive=False, extensions=None, allow_list=None):
+    logger = logging.getLogger(__name__)
+
+    input_path = line.strip()
+    response = {"input": input_path, "parsed": 0, "failed": 0}
+
+    if not os.path.exists(input_path):
+        logger.error(f"Input not found: {input_path}")
+        response["error"] = "not found"
+        return dumps_json(response) + b"\n"
+
+    try:
+        sources = iter_sources(input_path, None, recursive, extensions, allow_list)
+        for pmc_id, clean_text in pmc_parser.parse_many(sources):
+            if clean_text is None:
+                response["failed"] += 1
+            else:
+                response["parsed"] += 1
+    except Exception as e:
+        logger.error(f"Failed to read {input_path}")
+        logger.critical(traceback.format_exc())
+        response["error"] = repr(e)
+
+    return dumps_json(response) + b"\n"
+
+'''
+Server mode for callers that would otherwise start a parser per batch. 
+Input paths are read one per line from stdin if address is "-", 
+otherwise from connections to a Unix socket at address, and are parsed 
+by one PMCParser, so imports, the writer, and caches are set up once. 
+A response line is written back for each request line. There is no 
+manifest, every input sent is parsed.
+
+Runs until stdin is closed or the process gets SIGINT or SIGTERM. Bulk 
+output shards are closed when the server stops
+'''
+def serve(address, output_dir, output_format="xml", sections=SECTIONS, engine="line", 
+          shard_size=256, compression=None, max_article_size=None, recursive=False, 
+          extensions=None, allow_list=None):
+    import stat
+    import signal
+
+    logger = logging.getLogger(__name__)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    pmc_parser = PMCParser(sections, engine, output_format, output_dir, compression, 
+                           shard_size, max_article_size)
+    handle = partial(handle_request, pmc_parser, recursive=recursive, 
+                     extensions=extensions, allow_list=allow_list)
+
+    try:
+        if address == "-":
+            logger.info("Reading input paths from stdin")
+            for line in sys.stdin:
+                if line.strip():
+                    sys.stdout.buffer.write(handle(line))
+                    sys.stdout.buffer.flush()
+        else:
+            import socketserver
+
+            class RequestHandler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    for line in self.rfile:
+                        if line.strip():
+                            self.wfile.write(handle(line.decode("utf-8")))
+
+            # left over from a server that did not stop cleanly
+            if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+                os.remove(address)
+            with socketserver.UnixStreamServer(address, RequestHandler) as server:
+                logger.info(f"Reading input paths from {address}")
+                try:
+                    server.serve_forever()
+                finally:
+                    os.remove(address)
+    except KeyboardInterrupt:
+        logger.info("Stopping server")
+    finally:
+        pmc_parser.close()
+
 '''
 For command line usage
 '''
 if __name__ == "__main__":
+    import argparse
+
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", help="Directory containing PMC XML files",
-                        required=True)
+    parser.add_argument("-i", "--input", help="Directory containing PMC XML files " \
+                        "and/or tarballs (oa_package PMCxxxx.tar.gz or bulk " \
+                        "oa_*_xml.*.tar.gz archives), or a single tarball. Not used " \
+                        "with --serve", default=None)
     parser.add_argument("-o", "--output", help="Directory to write output files to",
                         required=True)
     parser.add_argument("-f", "--output-format", help="Output format, currently " \
                         "XML, JSON, and plain text are supported and can be specified " \
-                        "using the strings 'xml', 'json', or 'text'", default="xml")
+                        "using the strings 'xml', 'json', or 'text'. For bulk output " \
+                        "to sharded files use 'jsonl' (gzipped JSON lines) or " \
+                        "'parquet' (requires pyarrow)", default="xml")
     parser.add_argument("-s", "--sections", help="Specify the desired sections for " \
                         "output. Sections should be follow the '-s' or '--sections' " \
                         "argument name and be space delimited, for example: " \
@@ -339,8 +2005,68 @@ if __name__ == "__main__":
                         action="store_true", default=False)
     parser.add_argument("-d", "--debug", help="Set log level to DEBUG", action="store_true", 
                         default=False)
+    parser.add_argument("-w", "--workers", help="Number of worker processes to parse " \
+                        "with. By default parses in a single process", type=int, default=1)
+    parser.add_argument("-c", "--chunk-size", help="Number of files sent to a worker " \
+                        "process at a time when using multiple workers", type=int, 
+                        default=64)
+    parser.add_argument("--shard-size", help="Size in MB of uncompressed text " \
+                        "after which bulk output moves to a new shard file", type=int, 
+                        default=256)
+    parser.add_argument("-e", "--engine", help="Parsing engine, 'line' for the " \
+                        "line-based engine or 'stream' for the streaming XML engine", 
+                        default="line")
+    parser.add_argument("--force", help="Process every input, even those the " \
+                        "manifest in the output directory lists as unchanged", 
+                        action="store_true", default=False)
+    parser.add_argument("-r", "--recursive", help="Also read inputs from " \
+                        "subdirectories of the input directory, for example an " \
+                        "oa_package/xx/yy/ tree", action="store_true", default=False)
+    parser.add_argument("-x", "--extensions", help="Only read input files with these " \
+                        "endings, space delimited, for example: '-x .nxml .tar.gz'", 
+                        nargs="*", default=None)
+    parser.add_argument("-a", "--allow-list", help="File with one PMC ID per line, " \
+                        "such as specialized_articles. Only these articles are parsed", 
+                        default=None)
+    parser.add_argument("--stats", help="Collect per-stage timings and throughput, " \
+                        "report them while running, and write parser-stats.json to " \
+                        "the output directory", action="store_true", default=False)
+    parser.add_argument("--stats-interval", help="Seconds between stats reports", 
+                        type=float, default=60)
+    parser.add_argument("-z", "--compression", help="Compress output files with " \
+                        "'gzip' or 'zstd' (requires zstandard). jsonl shards are " \
+                        "gzipped and Parquet shards zstd compressed by default", 
+                        default=None, choices=["gzip", "zstd"])
+    parser.add_argument("--max-article-size", help="Size in MB of text after which " \
+                        "an article is logged as failed instead of parsed, to cap " \
+                        "memory use per worker", type=float, default=None)
+
+    parser.add_argument("--log-file", help="File to write the log to, an empty " \
+                        "string turns off the log file", default="pmc-parser.log")
+    parser.add_argument("--serve", help="Run as a server that parses input paths " \
+                        "(XMLs, tarballs, or directories) sent one per line, from " \
+                        "stdin if '-', otherwise from connections to a Unix socket at " \
+                        "this path. A JSON line with the counts of parsed and failed " \
+                        "articles is sent back for each path. Parses in one process, " \
+                        "without a manifest", default=None)
 
     args = parser.parse_args()
-    
-    parse_xmls(args.input, args.output, args.output_format, args.sections, 
-                args.quiet, args.debug)   
+
+    if args.serve is not None:
+        # responses go to stdout, so the console log goes to stderr
+        initialize_logger(args.debug, args.quiet, args.log_file, sys.stderr)
+        allow_list = None
+        if args.allow_list:
+            allow_list = load_allow_list(args.allow_list)
+        extensions = tuple(args.extensions) if args.extensions else None
+        serve(args.serve, args.output, args.output_format, validate_sections(args.sections),
+              args.engine, args.shard_size, args.compression, args.max_article_size, 
+              args.recursive, extensions, allow_list)
+    elif args.input is None:
+        parser.error("the following arguments are required: -i/--input")
+    else:
+        parse_xmls(args.input, args.output, args.output_format, args.sections, 
+                    args.quiet, args.debug, args.workers, args.chunk_size, args.engine, 
+                    args.shard_size, args.force, args.recursive, args.extensions, 
+                    args.allow_list, args.stats, args.stats_interval, 
+                    args.max_article_size, args.compression, args.log_file)   
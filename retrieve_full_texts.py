@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+import os
+import re
+import sys
+import time
+import random
+import ftplib
+import logging
+import argparse
+import threading
+import queue
+import http.client
+from functools import partial
+from urllib.parse import urlsplit, urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+import parser as pmc_parser
+
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+FTP_URL = "ftp://ftp.ncbi.nlm.nih.gov/pub/pmc"
+
+# Articles in an efetch pmc-articleset, and the PMC ID of each
+ARTICLE_REGEX = re.compile(rb"<article[\s>].*?</article>", re.DOTALL)
+ARTICLE_ID_REGEX = re.compile(rb"<article-id pub-id-type=\"pmc(?:id)?\">\s*(?:PMC)?(\d+)\s*" \
+                              rb"</article-id>")
+XML_DECLARATION = b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+# efetch statuses that can be caused by some of the IDs in a request, a 
+# malformed ID or a URL that is too long. Batches failing with these are 
+# split to find the IDs
+SPLIT_STATUSES = {400, 414}
+
+'''
+Raised when a request fails. retryable is False for responses that will
+not change on retry, like a 404. status is the HTTP status if there was 
+a response
+'''
+class FetchError(Exception):
+    def __init__(self, message, retryable=True, status=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+
+'''
+Raised in download threads once downloads have been cancelled, for 
+example because the parser fed by them stopped
+'''
+class DownloadCancelled(Exception):
+    pass
+
+'''
+Token bucket shared by all workers. Allows rate requests per second on
+average and bursts of up to capacity requests
+'''
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+'''
+Fetches URLs over HTTP(S) or FTP, keeping one open connection per host
+in each thread so that requests reuse connections
+'''
+class Fetcher:
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connections(self):
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+
+        return self.local.connections
+
+    def fetch(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        connections = self.connections()
+
+        try:
+            if parts.scheme in ("http", "https"):
+                return self.fetch_http(parts, key, connections)
+            if parts.scheme == "ftp":
+                return self.fetch_ftp(parts, key, connections)
+        # ftplib.all_errors includes EOFError, raised when a server drops a 
+        # kept alive control connection
+        except (http.client.HTTPException, *ftplib.all_errors) as e:
+            self.drop(key, connections)
+            retryable = not isinstance(e, ftplib.error_perm)
+            raise FetchError(f"{url}: {repr(e)}", retryable) from e
+
+        raise FetchError(f"Unsupported URL scheme: {url}", retryable=False)
+
+    def fetch_http(self, parts, key, connections):
+        connection = connections.get(key)
+        if connection is None:
+            connection_class = http.client.HTTPConnection
+            if parts.scheme == "https":
+                connection_class = http.client.HTTPSConnection
+            connection = connection_class(parts.netloc, timeout=self.timeout)
+            connections[key] = connection
+
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        connection.request("GET", path)
+        response = connection.getresponse()
+        data = response.read()
+
+        if response.will_close:
+            self.drop(key, connections)
+
+        if response.status != 200:
+            retryable = response.status == 429 or response.status >= 500
+            raise FetchError(f"{parts.geturl()}: HTTP {response.status}", retryable, 
+                             response.status)
+
+        return data
+
+    def fetch_ftp(self, parts, key, connections):
+        ftp = connections.get(key)
+        if ftp is None:
+            ftp = ftplib.FTP(timeout=self.timeout)
+            ftp.connect(parts.hostname, parts.port or 21)
+            ftp.login(parts.username or "anonymous", parts.password or "")
+            connections[key] = ftp
+
+        chunks = []
+        ftp.retrbinary(f"RETR {parts.path}", chunks.append)
+
+        return b"".join(chunks)
+
+    def drop(self, key, connections):
+        connection = connections.pop(key, None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+'''
+Fetches url, waiting on the bucket before every attempt and retrying
+failed attempts with exponential backoff and jitter. Raises 
+DownloadCancelled instead of starting an attempt once cancelled, a 
+threading.Event, is set
+'''
+def fetch_with_retries(fetcher, bucket, url, retries=5, backoff=1.0, cancelled=None):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        if cancelled is not None and cancelled.is_set():
+            raise DownloadCancelled()
+        try:
+            return fetcher.fetch(url)
+        except FetchError as e:
+            if not e.retryable or attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+'''
+Writes data to fp through a temporary file and a rename, so a partly
+written file is never left at fp
+'''
+def write_atomic(fp, data):
+    temp_fp = f"{fp}.part"
+    with open(temp_fp, "wb") as out:
+        out.write(data)
+    os.replace(temp_fp, fp)
+
+'''
+Hands a downloaded payload on: writes it to output_fp if there is one,
+and passes it to sink, a callable taking (name, data), if there is one
+'''
+def deliver(name, data, output_fp, sink=None):
+    if output_fp is not None:
+        write_atomic(output_fp, data)
+    if sink is not None:
+        sink(name, data)
+
+'''
+Handles an item whose output_fp already exists without making a 
+request. If there is a sink the file is read and passed to it, so a 
+resumed run still parses articles that were archived but not parsed. 
+Returns "skipped" or an error
+'''
+def deliver_existing(name, output_fp, sink=None):
+    if sink is not None:
+        try:
+            with open(output_fp, "rb") as handle:
+                sink(name, handle.read())
+        except OSError as e:
+            return f"failed: {e}"
+
+    return "skipped"
+
+'''
+Downloads one item, a (name, url, output filepath) tuple, and delivers
+it. Items whose output already exists are not downloaded again, so 
+interrupted runs can be resumed, see deliver_existing. Returns 
+(name, status), status is "downloaded", "skipped", or an error. Raises 
+DownloadCancelled once cancelled is set
+'''
+def download_item(item, fetcher, bucket, retries=5, backoff=1.0, sink=None, 
+                  cancelled=None):
+    name, url, output_fp = item
+
+    if output_fp is not None and os.path.exists(output_fp):
+        return name, deliver_existing(name, output_fp, sink)
+
+    try:
+        data = fetch_with_retries(fetcher, bucket, url, retries, backoff, cancelled)
+        deliver(name, data, output_fp, sink)
+    except (FetchError, OSError) as e:
+        return name, f"failed: {e}"
+
+    return name, "downloaded"
+
+'''
+Yields the results of futures in order. If a result raises or the 
+caller stops early, futures that have not started are cancelled
+'''
+def iter_results(executor, futures):
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+'''
+Downloads items on a pool of threads that share one rate limit. Yields
+(name, status) in the order of items. Once cancelled, a threading.Event, 
+is set no new requests are made and DownloadCancelled is raised
+'''
+def download_items(items, workers=8, rate=10, retries=5, backoff=1.0, timeout=60,
+                   sink=None, cancelled=None):
+    fetcher = Fetcher(timeout)
+    bucket = TokenBucket(rate)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_item, item, fetcher, bucket, retries, backoff, 
+                                   sink, cancelled) 
+                    for item in items]
+        yield from iter_results(executor, futures)
+
+'''
+Splits an efetch pmc-articleset into its articles. Returns a dict of
+normalized PMC ID to a standalone XML document of the article
+'''
+def split_article_set(data):
+    articles = {}
+    for match in ARTICLE_REGEX.finditer(data):
+        article = match.group(0)
+        pmc_id = ARTICLE_ID_REGEX.search(article)
+        if pmc_id is not None:
+            articles[f"PMC{pmc_id.group(1).decode()}"] = XML_DECLARATION + article
+
+    return articles
+
+'''
+Returns the efetch URL for a list of PMC IDs
+'''
+def efetch_url(pmc_ids, base_url=EFETCH_URL, api_key=None):
+    params = {"db": "pmc", "id": ",".join(pmc_ids)}
+    if api_key:
+        params["api_key"] = api_key
+    params.update({"rettype": "xml", "retmode": "text"})
+
+    return f"{base_url}?{urlencode(params)}"
+
+'''
+Requests the IDs in pending, a dict of pmc_id to output filepath, and 
+delivers the returned articles, removing them from pending. IDs missing 
+from the response, or left over from a failed request, are requested 
+again, up to rounds requests in all. Returns the statuses of delivered 
+IDs and the error of the last request, or None if it succeeded
+'''
+def fetch_pending(pending, fetcher, bucket, base_url=EFETCH_URL, api_key=None, retries=5,
+                  backoff=1.0, rounds=3, sink=None, cancelled=None):
+    statuses = {}
+    error = None
+    for _ in range(rounds):
+        if not pending:
+            break
+
+        try:
+            data = fetch_with_retries(fetcher, bucket, efetch_url(pending, base_url, api_key),
+                                      retries, backoff, cancelled)
+        except FetchError as e:
+            error = e
+            if not e.retryable:
+                break
+            continue
+
+        error = None
+        articles = split_article_set(data)
+        for pmc_id, output_fp in list(pending.items()):
+            article = articles.get(pmc_parser.normalize_pmc_id(pmc_id))
+            if article is None:
+                continue
+            try:
+                deliver(pmc_id, article, output_fp, sink)
+                statuses[pmc_id] = "downloaded"
+            except OSError as e:
+                statuses[pmc_id] = f"failed: {e}"
+            del pending[pmc_id]
+
+    return statuses, error
+
+'''
+Returns the status of IDs that could not be downloaded
+'''
+def failed_status(error):
+    return f"failed: {error}" if error else "failed: missing from response"
+
+'''
+Downloads pending after a request for all of it failed with status, one
+of SPLIT_STATUSES, by requesting each half on its own. Halves that fail 
+the same way are split again, so only the IDs that cause the error 
+fail. If both halves fail with status the error does not depend on the 
+IDs, like a bad API key, and all of them fail without more requests
+'''
+def split_pending(pending, status, fetcher, bucket, base_url=EFETCH_URL, api_key=None,
+                  retries=5, backoff=1.0, rounds=3, sink=None, cancelled=None):
+    items = list(pending.items())
+    half = len(items) // 2
+
+    parts = []
+    for part in (items[:half], items[half:]):
+        part_pending = dict(part)
+        part_statuses, error = fetch_pending(part_pending, fetcher, bucket, base_url, 
+                                             api_key, retries, backoff, rounds, sink, 
+                                             cancelled)
+        parts.append((part_pending, part_statuses, error))
+
+    split = not all(error is not None and error.status == status for _, _, error in parts)
+
+    statuses = {}
+    for part_pending, part_statuses, error in parts:
+        statuses.update(part_statuses)
+        if split and error is not None and error.status in SPLIT_STATUSES \
+                and len(part_pending) > 1:
+            statuses.update(split_pending(part_pending, error.status, fetcher, bucket, 
+                                          base_url, api_key, retries, backoff, rounds, sink,
+                                          cancelled))
+        else:
+            statuses.update({pmc_id: failed_status(error) for pmc_id in part_pending})
+
+    return statuses
+
+'''
+Downloads a batch of (pmc_id, output filepath) items with one efetch
+request, splitting the returned article set into one file per article.
+Items whose output already exists are handled with deliver_existing.
+IDs missing from the response, or left over from a failed request, are
+fetched again, up to rounds requests in all. If a request fails with a 
+status that can be caused by a single ID, like a 400 for a malformed 
+ID, the batch is split to find it with split_pending. Returns a list of 
+(pmc_id, status) like download_item
+'''
+def download_batch(batch, fetcher, bucket, base_url=EFETCH_URL, api_key=None, retries=5,
+                   backoff=1.0, rounds=3, sink=None, cancelled=None):
+    statuses = {}
+    pending = {}
+    for pmc_id, output_fp in batch:
+        if output_fp is not None and os.path.exists(output_fp):
+            statuses[pmc_id] = deliver_existing(pmc_id, output_fp, sink)
+        else:
+            pending[pmc_id] = output_fp
+
+    fetched, error = fetch_pending(pending, fetcher, bucket, base_url, api_key, retries, 
+                                   backoff, rounds, sink, cancelled)
+    statuses.update(fetched)
+
+    if error is not None and error.status in SPLIT_STATUSES and len(pending) > 1:
+        statuses.update(split_pending(pending, error.status, fetcher, bucket, base_url, 
+                                      api_key, retries, backoff, rounds, sink, cancelled))
+    else:
+        statuses.update({pmc_id: failed_status(error) for pmc_id in pending})
+
+    return [(pmc_id, statuses[pmc_id]) for pmc_id, _ in batch]
+
+'''
+Downloads PMC IDs from efetch in batches of batch_size on a pool of
+threads that share one rate limit. Yields (pmc_id, status) in order. If
+output_dir is None articles are only passed to sink. Stops like 
+download_items once cancelled is set
+'''
+def download_batches(pmc_ids, output_dir, batch_size=100, base_url=EFETCH_URL, api_key=None,
+                     workers=8, rate=10, retries=5, backoff=1.0, timeout=60, sink=None,
+                     cancelled=None):
+    fetcher = Fetcher(timeout)
+    bucket = TokenBucket(rate)
+
+    items = [(pmc_id, output_path(output_dir, f"{pmc_id}.xml")) for pmc_id in pmc_ids]
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_batch, batch, fetcher, bucket, base_url, api_key, 
+                                   retries, backoff, 3, sink, cancelled) 
+                    for batch in batches]
+        for statuses in iter_results(executor, futures):
+            yield from statuses
+
+'''
+Returns the path of file_name in output_dir, or None without output_dir
+'''
+def output_path(output_dir, file_name):
+    if output_dir is None:
+        return None
+
+    return os.path.join(output_dir, file_name)
+
+'''
+Returns the lines of a file of IDs or FTP paths, stripped of whitespace
+'''
+def read_ids(fp):
+    with open(fp, "r") as handle:
+        return [line.strip() for line in handle if line.strip()]
+
+'''
+Returns download items for oa_package paths from the PMC FTP server, or
+any server with the same layout. If output_dir is None downloads are
+only passed to a sink
+'''
+def ftp_items(ftp_paths, output_dir, base_url=FTP_URL):
+    items = []
+    for ftp_path in ftp_paths:
+        url = f"{base_url.rstrip('/')}/{ftp_path.lstrip('/')}"
+        items.append((ftp_path, url, output_path(output_dir, os.path.basename(ftp_path))))
+
+    return items
+
+'''
+Bounded queue between the download threads and the parser. put blocks
+while the queue is full, so downloads wait for the parser rather than
+piling up in memory. Iterating yields parser sources, (PMC ID, XML bytes,
+name), until close is called. oa_package tarballs are unpacked in memory.
+Once cancelled, put raises DownloadCancelled, which stops the downloads
+'''
+class ParseQueue:
+    def __init__(self, maxsize=64):
+        self.queue = queue.Queue(maxsize)
+        self.cancelled = threading.Event()
+
+    def put(self, name, data):
+        while True:
+            if self.cancelled.is_set():
+                raise DownloadCancelled()
+            try:
+                self.queue.put((name, data), timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        try:
+            self.put(None, None)
+        except DownloadCancelled:
+            pass
+
+    '''
+    Stops the queue when the parser exits early, so that blocked
+    download threads finish and no more downloads are started
+    '''
+    def cancel(self):
+        self.cancelled.set()
+
+    def __iter__(self):
+        while True:
+            name, data = self.queue.get()
+            if name is None:
+                return
+
+            if name.endswith(pmc_parser.TARBALL_EXTENSIONS):
+                for pmc_id, source in pmc_parser.iter_tarball(data, name=name):
+                    yield pmc_id, source, name
+            else:
+                yield pmc_parser.normalize_pmc_id(pmc_parser.get_pmc_id(name)), data, name
+
+'''
+Logs the status of every download, returns counts of each status
+'''
+def log_statuses(statuses, logger):
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+    for name, status in statuses:
+        if status.startswith("failed"):
+            counts["failed"] += 1
+            logger.error(f"{name}: {status}")
+        else:
+            counts[status] += 1
+            logger.debug(f"{name}: {status}")
+
+    return counts
+
+'''
+Downloads and parses in one pass without writing raw XML to disk, unless
+archive_dir is set. Downloads run on a background thread and feed the
+parser through a ParseQueue of queue_size payloads, so downloading and
+parsing overlap. download takes a sink and a cancelled Event and returns 
+download statuses, for example partial(download_batches, pmc_ids, 
+archive_dir). If the parser stops, remaining downloads are cancelled. parse_args
+are passed on to parser.parse_sources
+'''
+def fetch_and_parse(download, output_dir, queue_size=64, **parse_args):
+    logger = logging.getLogger(__name__)
+    parse_queue = ParseQueue(queue_size)
+    counts = {}
+
+    def run_downloads():
+        try:
+            counts.update(log_statuses(download(sink=parse_queue.put, 
+                                                cancelled=parse_queue.cancelled), logger))
+        except DownloadCancelled:
+            logger.warning("Downloads cancelled, the parser stopped")
+        except Exception as e:
+            logger.error(f"Downloads stopped: {repr(e)}")
+        finally:
+            parse_queue.close()
+
+    thread = threading.Thread(target=run_downloads, daemon=True)
+    thread.start()
+
+    try:
+        pmc_parser.parse_sources(parse_queue, output_dir, **parse_args)
+    finally:
+        parse_queue.cancel()
+        thread.join()
+
+    return counts
+
+'''
+Get a logger
+'''
+def initialize_logger(name="retrieve_full_texts", debug=False, quiet=False):
+    level = logging.INFO
+    if debug:
+        level = logging.DEBUG
+
+    # Set up logging
+    logger = logging.getLogger(__name__)
+    logger.setLevel(level)
+    handler = logging.FileHandler(f"{name}.log")
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+    if not quiet:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setLevel(level)
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    return logger
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", help="'efetch' to download XMLs by PMC ID from " \
+                        "E-utilities, or 'ftp' to download oa_package tarballs by path",
+                        choices=["efetch", "ftp"])
+    parser.add_argument("-i", "--input", help="File with one PMC ID (efetch) or FTP " \
+                        "path (ftp) per line", required=True)
+    parser.add_argument("-o", "--output", help="Directory to write downloads to, or " \
+                        "parser output to with --parse", default="pmc_xmls")
+    parser.add_argument("-b", "--base-url", help="Base URL to download from, for " \
+                        "example a local mirror or test server", default=None)
+    parser.add_argument("--batch-size", help="Number of PMC IDs per efetch request",
+                        type=int, default=100)
+    parser.add_argument("-k", "--key-file", help="File containing an NCBI API key",
+                        default="ncbi.key")
+    parser.add_argument("-w", "--workers", help="Number of download threads", type=int,
+                        default=8)
+    parser.add_argument("-r", "--rate", help="Maximum requests per second across all " \
+                        "threads. Defaults to 10 with an API key and 3 without",
+                        type=float, default=None)
+    parser.add_argument("--retries", help="Number of retries for a failed request",
+                        type=int, default=5)
+    parser.add_argument("-p", "--parse", help="Parse downloads as they arrive instead " \
+                        "of writing them to disk", action="store_true", default=False)
+    parser.add_argument("--archive", help="With --parse, also write downloads to this " \
+                        "directory. Articles already in it are parsed from it without being " \
+                        "downloaded again", default=None)
+    parser.add_argument("--queue-size", help="With --parse, number of downloads held " \
+                        "in memory waiting for the parser", type=int, default=64)
+    parser.add_argument("-f", "--output-format", help="With --parse, parser output " \
+                        "format: 'xml', 'json', 'text', 'jsonl', or 'parquet'", default="xml")
+    parser.add_argument("-z", "--compression", help="With --parse, compress parser " \
+                        "output with 'gzip' or 'zstd'", default=None,
+                        choices=["gzip", "zstd"])
+    parser.add_argument("-s", "--sections", help="With --parse, sections to write, " \
+                        "space delimited", nargs="*", default=["title", "abstract", "body"])
+    parser.add_argument("-e", "--engine", help="With --parse, parsing engine, 'line' " \
+                        "or 'stream'", default="line")
+    parser.add_argument("--parse-workers", help="With --parse, number of parser " \
+                        "processes", type=int, default=1)
+    parser.add_argument("-q", "--quiet", help="Suppress printing of log messages to " \
+                        "STDOUT", action="store_true", default=False)
+    parser.add_argument("-d", "--debug", help="Set log level to DEBUG", action="store_true",
+                        default=False)
+    args = parser.parse_args()
+
+    logger = initialize_logger(debug=args.debug, quiet=args.quiet)
+    os.makedirs(args.output, exist_ok=True)
+
+    api_key = None
+    if args.mode == "efetch" and os.path.isfile(args.key_file):
+        with open(args.key_file, "r") as handle:
+            api_key = handle.read().strip()
+
+    rate = args.rate
+    if rate is None:
+        rate = 10 if api_key else 3
+
+    download_dir = args.output
+    if args.parse:
+        download_dir = args.archive
+        if download_dir is not None:
+            os.makedirs(download_dir, exist_ok=True)
+        pmc_parser.initialize_logger(args.debug, args.quiet)
+
+    if args.mode == "efetch":
+        pmc_ids = read_ids(args.input)
+        logger.info(f"Downloading {len(pmc_ids)} articles in batches of {args.batch_size} " \
+                    f"at up to {rate} requests/s")
+        download = partial(download_batches, pmc_ids, download_dir, args.batch_size,
+                           args.base_url or EFETCH_URL, api_key, args.workers, rate,
+                           args.retries)
+    else:
+        items = ftp_items(read_ids(args.input), download_dir, args.base_url or FTP_URL)
+        logger.info(f"Downloading {len(items)} items at up to {rate} requests/s")
+        download = partial(download_items, items, args.workers, rate, args.retries)
+
+    if args.parse:
+        sections = pmc_parser.validate_sections(args.sections)
+        counts = fetch_and_parse(download, args.output, args.queue_size,
+                                 output_format=args.output_format, sections=sections,
+                                 workers=args.parse_workers, engine=args.engine,
+                                 compression=args.compression)
+    else:
+        counts = log_statuses(download(), logger)
+
+    logger.info(f"Done: {counts}")
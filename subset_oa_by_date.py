@@ -1,15 +1,10 @@
+from oa_index import load_oa_index, decode
 
 if __name__ == "__main__":
+    index = load_oa_index("oa_file_list.csv")
 
-    with open("oa_file_list.csv", "r") as handle:
-        with open("oa_last_10_years.csv", "w") as out:
-            for line in handle:
-                line = line.split(",")
-                try:
-                    year = int(line[1].split(";")[0].split()[-3])
-                except:
-                    print(f"Could not get year for: {line[2]}")
-                    year = 0
+    for pmc_id in decode(index.pmcid[index.year == 0]):
+        print(f"Could not get year for: {pmc_id}")
 
-                if year > 2009:
-                    out.write(",".join(line))
+    with open("oa_last_10_years.csv", "wb") as out:
+        index.write_lines(index.year > 2009, out)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import gzip
+import json
+import shutil
+import tarfile
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import parser as pmc_parser
+
+ARTICLE = "<?xml version=\"1.0\"?>\n<article>\n<front>\n<article-meta>\n" \
+          "<title-group>\n<article-title>Article {0}</article-title>\n</title-group>\n" \
+          "<abstract>\n<p>The abstract of article {0}, long enough to be kept.</p>\n" \
+          "</abstract>\n" \
+          "</article-meta>\n</front>\n<body>\n<sec>\n<title>Results</title>\n" \
+          "<p>The body of article {0}, also long enough to be kept.</p>\n</sec>\n" \
+          "</body>\n</article>\n"
+
+'''
+Writes a bulk tarball with num_articles XMLs named PMC1.xml onwards
+'''
+def write_bulk_tarball(fp, num_articles):
+    with tarfile.open(fp, "w:gz") as tar:
+        for i in range(1, num_articles + 1):
+            data = ARTICLE.format(i).encode()
+            member = tarfile.TarInfo(f"oa_comm/PMC{i}.xml")
+            member.size = len(data)
+            tar.addfile(member, io.BytesIO(data))
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.work_dir, "input")
+        self.output_dir = os.path.join(self.work_dir, "output")
+        os.makedirs(self.input_dir)
+        os.makedirs(self.output_dir)
+        write_bulk_tarball(os.path.join(self.input_dir, "oa_comm_xml.PMC001.tar.gz"), 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def parse(self):
+        pmc_parser.parse_xmls(self.input_dir, self.output_dir, "jsonl", quiet=True,
+                              log_file=os.path.join(self.work_dir, "pmc-parser.log"))
+
+    def read_output(self):
+        pmc_ids = []
+        for name in sorted(os.listdir(self.output_dir)):
+            if name.endswith(".jsonl.gz"):
+                with gzip.open(os.path.join(self.output_dir, name), "rt") as handle:
+                    pmc_ids.extend(json.loads(line)["pmc_id"] for line in handle)
+
+        return pmc_ids
+
+    def read_manifest(self):
+        with open(os.path.join(self.output_dir, "manifest.jsonl"), "r") as handle:
+            return [json.loads(line) for line in handle][1:]
+
+    def test_interrupted_input_is_processed_again(self):
+        parse_xml = pmc_parser.parse_xml
+        calls = []
+        def interrupt_on_fourth(source, **kwargs):
+            calls.append(source)
+            if len(calls) == 4:
+                raise KeyboardInterrupt
+            return parse_xml(source, **kwargs)
+
+        with mock.patch.object(pmc_parser, "parse_xml", interrupt_on_fourth):
+            with self.assertRaises(KeyboardInterrupt):
+                self.parse()
+
+        self.assertEqual(self.read_manifest(), [])
+        self.assertEqual(self.read_output(), [])
+        self.assertFalse([f for f in os.listdir(self.output_dir) if f.endswith(".tmp")])
+
+        self.parse()
+        self.assertEqual(len(self.read_manifest()), 1)
+        self.assertEqual(sorted(self.read_output()), sorted(f"PMC{i}" for i in range(1, 11)))
+
+        # a completed input is skipped
+        self.parse()
+        self.assertEqual(len(self.read_output()), 10)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "articles")
+
+'''
+Checks the cleanup and both engines against expected.json, the output 
+of the original line engine on the fixture articles. The articles have 
+no tables or multiple formulas, where the engines are known to differ
+'''
+class FixtureOutputTest(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(FIXTURE_DIR, "expected.json"), "r") as handle:
+            self.expected = json.load(handle)
+        self.fps = sorted(os.path.join(FIXTURE_DIR, f) for f in os.listdir(FIXTURE_DIR) 
+                            if f.endswith(".nxml"))
+
+    def test_engines_match_expected(self):
+        for fp in self.fps:
+            expected = self.expected[pmc_parser.get_pmc_id(fp)]
+            self.assertEqual(pmc_parser.parse_xml(fp), expected, fp)
+            self.assertEqual(pmc_parser.parse_xml_stream(fp), expected, fp)
+            # small chunks so that ChunkedBody cleans bodies in pieces
+            self.assertEqual(pmc_parser.parse_xml(fp, chunk_size=200), expected, fp)
+            self.assertEqual(pmc_parser.parse_xml_stream(fp, block_size=64, chunk_size=200), 
+                             expected, fp)
+
+    def test_cleanup_matches_expected(self):
+        for fp in self.fps:
+            with open(fp, "r") as handle:
+                text = handle.read()
+            expected = self.expected[pmc_parser.get_pmc_id(fp)]
+
+            # the raw sections as the line engine collects them
+            if "<abstract" in text:
+                abstract = text[text.index("<abstract"):text.index("</abstract>")]
+                self.assertEqual(pmc_parser.parse_abstract(abstract), expected["abstract"], fp)
+            if "<body" in text:
+                body = text[text.index("<body"):text.index("</body>")]
+                self.assertEqual(pmc_parser.parse_body(body), expected["body"], fp)
+
+class PMCParserTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_failed_articles_are_yielded_with_none(self):
+        sources = [("PMC1", ARTICLE.format(1).encode()),
+                   ("PMC2", b"<article>\n</article>\n"),
+                   ("PMC3", ARTICLE.format(3).encode()[:-40]),
+                   ("PMC4", b"<article>\n<front>\xff\xfe</front>\n</article>\n"),
+                   ("PMC5", os.path.join(self.work_dir, "PMC5.xml"))]
+
+        for engine in ["line", "stream"]:
+            with pmc_parser.PMCParser(engine=engine, logger=mock.Mock()) as parser:
+                results = dict(parser.parse_many(sources))
+
+            self.assertEqual(results["PMC1"]["body"], 
+                             "The body of article 1, also long enough to be kept.", engine)
+            self.assertEqual(results["PMC2"], {"title": "", "abstract": "", "body": ""}, engine)
+            for pmc_id in ["PMC3", "PMC4", "PMC5"]:
+                self.assertIsNone(results[pmc_id], f"{engine} {pmc_id}")
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.work_dir, "input")
+        self.output_dir = os.path.join(self.work_dir, "output")
+        os.makedirs(self.input_dir)
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_bad_files_are_counted_as_failed(self):
+        with open(os.path.join(self.input_dir, "PMC1.xml"), "w") as out:
+            out.write(ARTICLE.format(1))
+        # cut off inside the body
+        with open(os.path.join(self.input_dir, "PMC2.xml"), "w") as out:
+            out.write(ARTICLE.format(2)[:-40])
+
+        parser_fp = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parser.py")
+        output = subprocess.run([sys.executable, parser_fp, "--serve", "-", "-q", 
+                                 "-o", self.output_dir, "--log-file", ""],
+                                input=f"{self.input_dir}\n", capture_output=True, text=True, 
+                                timeout=60, check=True).stdout
+
+        self.assertEqual(json.loads(output), {"input": self.input_dir, "parsed": 1, "failed": 1})
+        self.assertEqual(os.listdir(self.output_dir), ["PMC1.xml"])
+
+if __name__ == "__main__":
+    unittest.main()
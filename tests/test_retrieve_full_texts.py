@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import retrieve_full_texts as rft
+
+ARTICLE = "<article article-type=\"research-article\"><front><article-meta>" \
+          "<article-id pub-id-type=\"pmc\">{}</article-id><title-group><article-title>" \
+          "Article {}</article-title></title-group></article-meta></front></article>"
+
+'''
+Local stand-in for efetch. If status is set every request gets it, like
+a wrong URL or API key. Otherwise requests for an ID in bad get a 400, 
+the first fail_count requests get a 503, and IDs in missing are left out
+of the returned article set
+'''
+class MockEfetch(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        ids = parse_qs(urlsplit(self.path).query)["id"][0].split(",")
+        with server.lock:
+            server.requests.append(ids)
+            fail = len(server.requests) <= server.fail_count
+
+        if server.status is not None:
+            self.respond(server.status, b"")
+        elif fail:
+            self.respond(503, b"")
+        elif any(pmc_id in server.bad for pmc_id in ids):
+            self.respond(400, b"Invalid id")
+        else:
+            articles = [ARTICLE.format(pmc_id[3:], pmc_id) for pmc_id in ids 
+                            if pmc_id not in server.missing]
+            body = "<?xml version=\"1.0\"?>\n<pmc-articleset>{}</pmc-articleset>"
+            self.respond(200, body.format("\n".join(articles)).encode())
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class DownloadBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("localhost", 0), MockEfetch)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.fail_count = 0
+        self.server.bad = set()
+        self.server.missing = set()
+        self.server.status = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.base_url = f"http://localhost:{self.server.server_address[1]}/efetch.fcgi"
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.output_dir)
+
+    def download(self, pmc_ids, batch_size=100):
+        return dict(rft.download_batches(pmc_ids, self.output_dir, batch_size, self.base_url, 
+                                         workers=2, rate=1000, retries=3, backoff=0.01))
+
+    def test_articles_are_split_into_files(self):
+        pmc_ids = [f"PMC{i}" for i in range(1, 11)]
+        statuses = self.download(pmc_ids, batch_size=4)
+
+        self.assertEqual(set(statuses.values()), {"downloaded"})
+        self.assertEqual(len(self.server.requests), 3)
+        with open(os.path.join(self.output_dir, "PMC7.xml"), "rb") as handle:
+            article = handle.read()
+        self.assertTrue(article.startswith(rft.XML_DECLARATION))
+        self.assertIn(b"<article-title>Article PMC7</article-title>", article)
+
+        # outputs that exist are skipped without a request
+        self.assertEqual(set(self.download(pmc_ids).values()), {"skipped"})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_existing_outputs_are_passed_to_sink(self):
+        pmc_ids = [f"PMC{i}" for i in range(1, 6)]
+        self.download(pmc_ids)
+
+        delivered = {}
+        statuses = dict(rft.download_batches(pmc_ids, self.output_dir, 100, self.base_url,
+                                             workers=2, rate=1000, sink=delivered.__setitem__))
+
+        self.assertEqual(set(statuses.values()), {"skipped"})
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(sorted(delivered), pmc_ids)
+        self.assertIn(b"<article-title>Article PMC3</article-title>", delivered["PMC3"])
+
+    def test_missing_ids_are_refetched_then_failed(self):
+        self.server.missing = {"PMC3"}
+        statuses = self.download([f"PMC{i}" for i in range(1, 6)])
+
+        self.assertEqual(statuses["PMC3"], "failed: missing from response")
+        self.assertEqual([s for s in statuses.values() if s == "downloaded"], ["downloaded"] * 4)
+        self.assertEqual(self.server.requests[1:], [["PMC3"], ["PMC3"]])
+
+    def test_server_errors_are_retried(self):
+        self.server.fail_count = 2
+        statuses = self.download(["PMC1", "PMC2"])
+
+        self.assertEqual(set(statuses.values()), {"downloaded"})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_split_the_batch(self):
+        self.server.bad = {"PMC6"}
+        pmc_ids = [f"PMC{i}" for i in range(1, 9)]
+        statuses = self.download(pmc_ids)
+
+        self.assertTrue(statuses["PMC6"].startswith("failed"))
+        self.assertIn("HTTP 400", statuses["PMC6"])
+        for pmc_id in pmc_ids:
+            if pmc_id != "PMC6":
+                self.assertEqual(statuses[pmc_id], "downloaded")
+        # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1, only requests holding PMC6 are split
+        self.assertEqual(len(self.server.requests), 7)
+
+    def test_client_errors_for_every_id_stop_splitting(self):
+        # efetch answers a bad API key with a 400
+        self.server.status = 400
+        statuses = self.download([f"PMC{i}" for i in range(1, 9)])
+
+        self.assertTrue(all("HTTP 400" in status for status in statuses.values()))
+        # 8 -> 4 + 4, both halves fail the same way
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_other_client_errors_do_not_split(self):
+        self.server.status = 404
+        statuses = self.download([f"PMC{i}" for i in range(1, 9)])
+
+        self.assertTrue(all("HTTP 404" in status for status in statuses.values()))
+        self.assertEqual(len(self.server.requests), 1)
+
+if __name__ == "__main__":
+    unittest.main()